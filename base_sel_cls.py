@@ -0,0 +1,850 @@
+"""
+Общий движок для автоматизации рабочих процессов в браузере: ожидания, повторы, клики, поиск элементов,
+перехват ответов и логирование. Браузеры подключаются наследниками BaseSeleniumBrow:
+    * frfx_hlss_sel_cls.SeleniumBrow - Firefox;
+    * chrm_sel_cls.SeleniumBrow - Chrome.
+Каждый наследник сам собирает свои настройки(make_options) и запускает драйвер(create_browser).
+Выбрать браузер по имени - make_browser("firefox" | "chrome", ...).
+"""
+
+import atexit
+import datetime
+import json
+from importlib import import_module
+from logging.handlers import QueueHandler, QueueListener
+from random import uniform
+from typing import Callable
+from urllib.parse import quote
+import logging
+import os
+import os.path
+import queue
+import time
+import warnings
+
+from selenium.common.exceptions import (
+    TimeoutException,
+    ElementClickInterceptedException,
+    NoSuchElementException,
+    StaleElementReferenceException,
+)
+from selenium.webdriver import ActionChains
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.webdriver.support import expected_conditions as EC
+
+import sel_artifacts
+
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Модули браузеров для make_browser.
+BROWSERS = {
+    "firefox": "frfx_hlss_sel_cls",
+    "chrome": "chrm_sel_cls",
+}
+
+# Сторонние хосты(счетчики, аналитика), запросы к которым в облегченном профиле не уходят из браузера.
+# Дополняется через FRFX_BLOCK_HOSTS="host1,host2", полный список - lean_block_hosts().
+LEAN_BLOCK_HOSTS = [
+    "mc.yandex.ru",
+    "mc.yandex.com",
+    "top-fwz1.mail.ru",
+    "www.google-analytics.com",
+    "www.googletagmanager.com",
+    "ssl.google-analytics.com",
+    "stats.g.doubleclick.net",
+]
+
+
+def lean_block_hosts() -> list:
+    """LEAN_BLOCK_HOSTS и хосты из FRFX_BLOCK_HOSTS, читается при вызове, а не при импорте(.env грузится позже)."""
+    return LEAN_BLOCK_HOSTS + [host.strip() for host in os.getenv("FRFX_BLOCK_HOSTS", "").split(",") if host.strip()]
+
+# Отключает CSS анимации и переходы на текущей странице, чтобы элементы не ездили под кликами.
+JS_NO_ANIMATIONS = """
+if (!document.getElementById("frfx-no-animations")) {
+    var style = document.createElement("style");
+    style.id = "frfx-no-animations";
+    style.textContent = "*, *::before, *::after {animation: none !important; transition: none !important; scroll-behavior: auto !important;}";
+    (document.head || document.documentElement).appendChild(style);
+}
+return true;
+"""
+
+# Готова ли страница при page_load_strategy eager: документ разобран и есть body.
+JS_PAGE_READY = """
+return document.readyState !== "loading" && !!document.body;
+"""
+
+# Виден ли первый элемент по xpath(arguments[0]). Выполняется в браузере, поэтому не зависит от неявных ожиданий.
+JS_IS_VISIBLE = """
+var node = document.evaluate(arguments[0], document, null, XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue;
+return !!(node && node.getClientRects().length);
+"""
+
+# Ждет, пока DOM не будет меняться arguments[0] мс, но не дольше arguments[1] мс. Возвращает true, если дождался тишины.
+JS_WAIT_DOM_QUIET = """
+var quiet = arguments[0], limit = arguments[1], attributes = arguments[2], done = arguments[arguments.length - 1];
+var start = Date.now(), last = start;
+var observer = new MutationObserver(function () { last = Date.now(); });
+observer.observe(document, {childList: true, subtree: true, attributes: attributes, characterData: true});
+(function check() {
+    var current = Date.now();
+    if (current - last >= quiet || current - start >= limit) {
+        observer.disconnect();
+        done(current - last >= quiet);
+    } else {
+        setTimeout(check, 50);
+    }
+})();
+"""
+
+# Положение и размер элемента arguments[0] для проверки, что он перестал двигаться(скролл, анимация).
+JS_RECT = """
+var rect = arguments[0].getBoundingClientRect();
+return [rect.top, rect.left, rect.width, rect.height];
+"""
+
+# Перехват JSON ответов страницы: оборачивает XMLHttpRequest и fetch и складывает разобранные ответы, адрес которых
+# подходит под регулярку из arguments[0] = {имя: регулярка}, в window.__monikiCapture.items[имя]. Повторный вызов
+# только обновляет регулярки. После перезагрузки страницы перехват нужно включать заново.
+JS_CAPTURE_INSTALL = """
+var patterns = arguments[0];
+if (window.__monikiCapture) {
+    window.__monikiCapture.patterns = patterns;
+    return true;
+}
+var store = {patterns: patterns, items: {}};
+window.__monikiCapture = store;
+function keep(url, text) {
+    for (var name in store.patterns) {
+        if (new RegExp(store.patterns[name]).test(url)) {
+            try {
+                (store.items[name] = store.items[name] || []).push({url: url, data: JSON.parse(text), at: Date.now()});
+            } catch (e) {}
+        }
+    }
+}
+var open = XMLHttpRequest.prototype.open;
+var send = XMLHttpRequest.prototype.send;
+XMLHttpRequest.prototype.open = function (method, url) {
+    this.__monikiUrl = url;
+    return open.apply(this, arguments);
+};
+XMLHttpRequest.prototype.send = function () {
+    var xhr = this;
+    xhr.addEventListener("load", function () {
+        var url = xhr.responseURL || xhr.__monikiUrl;
+        if (xhr.responseType === "json") {
+            keep(url, JSON.stringify(xhr.response));
+        } else if (xhr.responseType === "" || xhr.responseType === "text") {
+            keep(url, xhr.responseText);
+        }
+    });
+    return send.apply(this, arguments);
+};
+if (window.fetch) {
+    var originalFetch = window.fetch;
+    window.fetch = function () {
+        return originalFetch.apply(this, arguments).then(function (response) {
+            response.clone().text().then(function (text) { keep(response.url, text); });
+            return response;
+        });
+    };
+}
+return true;
+"""
+
+# Забирает и очищает перехваченные ответы с именем arguments[0]. null, если перехват на странице не включен.
+JS_CAPTURE_TAKE = """
+var store = window.__monikiCapture;
+if (!store) {
+    return null;
+}
+var items = store.items[arguments[0]] || [];
+store.items[arguments[0]] = [];
+return items;
+"""
+
+
+def is_js_not_loaded(err: Exception) -> bool:
+    """Ошибка JS из-за того, что элемент еще не прогрузился в DOM, такую есть смысл повторять."""
+    text = str(err)
+    return "Cannot read properties of null" in text or "is null" in text or "no attribute" in text
+
+
+def is_transient_lookup(err: Exception) -> bool:
+    """Элемент еще не появился, перерисован или не дождались его - такой поиск есть смысл повторить."""
+    return isinstance(err, (StaleElementReferenceException, NoSuchElementException, TimeoutException))
+
+
+def is_transient_click(err: Exception) -> bool:
+    """
+    Клик перекрыт другим элементом или не дождался - такой клик по тому же элементу есть смысл повторить.
+    Перерисованный(stale) или недоступный для клика элемент повтор не оживит, это ошибка сразу.
+    """
+    if isinstance(err, StaleElementReferenceException):
+        return False
+    return isinstance(err, ElementClickInterceptedException) or is_transient_lookup(err)
+
+
+class ElementMissingError(LookupError):
+    """
+    Элемента, по которому нужно кликнуть, нет. Браузер не закрывается: ошибку разбирает тот, кто ведет сценарий,
+    и продолжает с последней контрольной точки(moniki_flow).
+    """
+
+
+class RetryPolicy:
+    """
+    Политика повторов для click, ex_sc и find_xpath: повторяет в цикле, а не рекурсией.
+        * max_attempts - максимум попыток, включая первую;
+        * deadline - сколько секунд всего можно потратить на попытки;
+        * base_delay, max_delay - пауза перед повтором растет как base_delay * 2^(попытка-1), но не больше max_delay;
+        * jitter - доля случайного разброса паузы, чтобы повторы не шли в ногу.
+    Количество попыток последнего вызова каждого метода лежит в attempts, а их распределение - в histogram,
+    чтобы настраивать политику по реальным цифрам.
+    """
+
+    def __init__(
+            self,
+            max_attempts: int = 5,
+            deadline: float = 30,
+            base_delay: float = 0.25,
+            max_delay: float = 4,
+            jitter: float = 0.5
+            ):
+        self.max_attempts = max_attempts
+        self.deadline = deadline
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self.attempts: dict = {}
+        self.histogram: dict = {}
+
+    def delay(self, attempt: int) -> float:
+        """Пауза перед повтором после попытки с номером attempt."""
+        delay = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        return max(0, delay * (1 + uniform(-self.jitter, self.jitter)))
+
+    def _report(self, name: str, attempt: int):
+        """Запоминает, сколько попыток ушло на вызов."""
+        self.attempts[name] = attempt
+        counts = self.histogram.setdefault(name, {})
+        counts[attempt] = counts.get(attempt, 0) + 1
+        if attempt > 1:
+            logging.info(f"[{name}] Потрачено попыток: {attempt}")
+
+    def run(self, func: Callable, *args, name: str = "", classify: Callable = None, accept: Callable = None, **kwargs):
+        """
+        Вызывает func(*args, **kwargs), пока не получится, и возвращает (результат, число попыток).
+            * classify(ошибка) -> bool - стоит ли повторять после этой ошибки, по умолчанию повторяются все;
+            * accept(результат) -> bool - подходит ли результат, по умолчанию подходит любой.
+        Если ошибка неповторяемая или попытки/время кончились, то бросает последнюю ошибку.
+        Если кончились попытки, а ошибки не было, то возвращает последний неподходящий результат.
+        """
+        start = time.monotonic()
+        attempt = 0
+        while True:
+            attempt += 1
+            error = None
+            try:
+                result = func(*args, **kwargs)
+                if accept is None or accept(result):
+                    self._report(name, attempt)
+                    return result, attempt
+            except Exception as err:
+                if classify is not None and not classify(err):
+                    self._report(name, attempt)
+                    raise
+                error = err
+                result = None
+            delay = self.delay(attempt)
+            if attempt >= self.max_attempts or time.monotonic() - start + delay > self.deadline:
+                self._report(name, attempt)
+                if error is not None:
+                    raise error
+                return result, attempt
+            time.sleep(delay)
+
+
+def now() -> str:
+    return datetime.datetime.now().strftime("%d.%m.%Y %H:%M:%S")
+
+
+# Логгеры, которые в режиме очереди пишутся только своими обработчиками, а не в общий лог.
+ERROR_LOGGER = "frfx_errors"
+SNAPSHOT_LOGGER = "frfx_snapshots"
+# Файл ошибок log_any_error по умолчанию, у Chrome свой(chrm_sel_cls.ERROR_FILE).
+ERROR_FILE = "frfx_class_error.txt"
+
+_listener: QueueListener = None
+
+
+class _NameFilter(logging.Filter):
+    """Пропускает записи только своих логгеров(include=True) или только чужих(include=False)."""
+
+    def __init__(self, names: tuple, include: bool):
+        super().__init__()
+        self.names = names
+        self.include = include
+
+    def filter(self, record) -> bool:
+        return (record.name in self.names) == self.include
+
+
+class _LazyQueueHandler(QueueHandler):
+    """Кладет запись в очередь как есть, форматирование остается фоновому потоку."""
+
+    def prepare(self, record):
+        return record
+
+
+class _SnapshotHandler(logging.Handler):
+    """Перезаписывает файл из record.snapshot_path текстом записи(например, html страницы)."""
+
+    def emit(self, record):
+        try:
+            with open(record.snapshot_path, "w", encoding="UTF-8") as file:
+                file.write(record.getMessage())
+        except Exception:
+            self.handleError(record)
+
+
+class _ErrorFileHandler(logging.Handler):
+    """Дописывает запись log_any_error в ее файл ошибок из record.error_file."""
+
+    def emit(self, record):
+        try:
+            with open(rf"{BASE_DIR}\{getattr(record, 'error_file', ERROR_FILE)}", "a+") as log:
+                print(self.format(record), file=log)
+        except Exception:
+            self.handleError(record)
+
+
+def enable_queue_logging() -> QueueListener:
+    """
+    Переводит логирование в фоновый режим: потоки скрипта только кладут записи в очередь,
+    а форматирование и запись в файлы делает QueueListener в своем потоке.
+    Обработчики корневого логгера переезжают в слушатель, туда же идут log_any_error и снимки страниц.
+    Повторный вызов ничего не делает.
+    """
+    global _listener
+    if _listener is not None:
+        return _listener
+    root = logging.getLogger()
+    own = (ERROR_LOGGER, SNAPSHOT_LOGGER)
+    handlers = root.handlers[:]
+    for handler in handlers:
+        handler.addFilter(_NameFilter(own, include=False))
+        root.removeHandler(handler)
+
+    error_handler = _ErrorFileHandler()
+    error_handler.setFormatter(logging.Formatter("[%(asctime)s] %(message)s", "%d.%m.%Y %H:%M:%S"))
+    error_handler.addFilter(_NameFilter((ERROR_LOGGER,), include=True))
+    snapshot_handler = _SnapshotHandler()
+    snapshot_handler.addFilter(_NameFilter((SNAPSHOT_LOGGER,), include=True))
+    for name in own:
+        logging.getLogger(name).setLevel(logging.INFO)
+
+    records = queue.SimpleQueue()
+    root.addHandler(_LazyQueueHandler(records))
+    _listener = QueueListener(records, *handlers, error_handler, snapshot_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(disable_queue_logging)
+    return _listener
+
+
+def disable_queue_logging():
+    """Дописывает всё из очереди и останавливает фоновый поток логирования."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def log_any_error(any_text, file_name: str = ERROR_FILE):
+    """Функция для записи ошибок в файл file_name рядом с модулем. В режиме очереди запись делает фоновый поток."""
+    if _listener is not None:
+        logging.getLogger(ERROR_LOGGER).error(str(any_text), extra={"error_file": file_name})
+        return
+    with open(rf"{BASE_DIR}\{file_name}", "a+") as log:
+        print(f"[{now()}] {str(any_text)}", file=log)
+
+
+def save_snapshot(path: str, text: str):
+    """Сохраняет текст(например, page_source) в файл. В режиме очереди запись делает фоновый поток."""
+    if _listener is not None:
+        logging.getLogger(SNAPSHOT_LOGGER).info(text, extra={"snapshot_path": path})
+        return
+    with open(path, "w", encoding="UTF-8") as file:
+        file.write(text)
+
+
+def notif(title="Заголовок", message="Сообщение."):
+    """Уведомляет о каких-либо событиях."""
+    from plyer import notification
+
+    notification.notify(
+        title=title,
+        message=message)
+
+
+def block_hosts_pac_script(hosts: list) -> str:
+    """
+    Текст PAC скрипта, который отправляет запросы к hosts(и их поддоменам) на закрытый локальный порт,
+    поэтому они сразу падают, а остальные запросы идут напрямую.
+    """
+    checks = " || ".join(f'host == "{host}" || dnsDomainIs(host, ".{host}")' for host in hosts) or "false"
+    return f"function FindProxyForURL(url, host) {{ if ({checks}) return 'PROXY 127.0.0.1:9'; return 'DIRECT'; }}"
+
+
+def block_hosts_pac(hosts: list) -> str:
+    """PAC скрипт block_hosts_pac_script в виде data: адреса для настроек Firefox."""
+    return "data:application/x-ns-proxy-autoconfig," + quote(block_hosts_pac_script(hosts))
+
+
+class BaseSeleniumBrow:
+    """
+    Создаем экземляр браузера, задаем ссылку и ожидание. Общая часть для всех браузеров.
+        * headless - без окна;
+        * lean - облегченный профиль: без картинок, шрифтов и анимаций, без сторонних счетчиков, page_load_strategy eager;
+        * profile - папка профиля браузера, None - временный профиль драйвера;
+        * page_load_strategy - normal/eager/none, None - по умолчанию(eager для lean).
+    main - устаревший параметр: раньше клик без элемента перезапускал main(), теперь ошибку разбирает сценарий
+    (ElementMissingError). Оставлен на своем месте, чтобы старые вызовы SeleniumBrow(link, main, time_wait) работали.
+    Ошибки log_any_error пишутся в ERROR_FILE браузера.
+    """
+
+    ERROR_FILE: str = ERROR_FILE
+
+    def __init__(
+            self,
+            link: str,
+            main: Callable = None,
+            time_wait: int = 120,
+            headless: bool = False,
+            retry_policy: RetryPolicy = None,
+            lean: bool = False,
+            profile: str = None,
+            page_load_strategy: str = None
+            ):
+        if main is not None:
+            warnings.warn(
+                "Параметр main больше не используется: ошибки кликов разбирает сценарий(ElementMissingError).",
+                DeprecationWarning, stacklevel=3)
+        self.link: str = link
+        self.name_main_func: Callable = main
+        self.time_wait: int = time_wait
+        self.retry: RetryPolicy = retry_policy or RetryPolicy()
+        self.capture_patterns: dict = None
+        # Id скрипта перехвата, который Chrome ставит сам на каждую новую страницу(CDP), и сколько раз перехват
+        # пропадал со страницы после перехода или перезагрузки(ответы до повторного включения потеряны).
+        self.capture_preload: str = None
+        self.capture_lost: int = 0
+        # Последний пропавший элемент: методы сценария ловят ошибки сами, поэтому она еще и запоминается(raise_if_failed).
+        self.failed: ElementMissingError = None
+        # Тик и шаг сценария для имен снимков страницы при ошибках(sel_artifacts), задает тот, кто ведет сценарий.
+        self.artifact_tags: dict = {"tick": None, "step": None}
+        self.resource: str = None
+        self.lean: bool = lean
+        self.options = self.make_options(headless=headless, lean=lean, profile=profile, page_load_strategy=page_load_strategy)
+        self.browser = self.create_browser(self.options)
+        self.browser.maximize_window()
+        self.actions = ActionChains(self.browser)
+
+    @staticmethod
+    def make_options(headless: bool = False, lean: bool = False, profile: str = None, page_load_strategy: str = None):
+        """Настройки браузера для одного экземпляра, задаются наследником."""
+        raise NotImplementedError
+
+    def create_browser(self, options):
+        """Запускает драйвер браузера с настройками options, задается наследником."""
+        raise NotImplementedError
+
+    def log_error(self, any_text):
+        """log_any_error в файл ошибок этого браузера."""
+        log_any_error(any_text, self.ERROR_FILE)
+
+    def disable_animations(self) -> bool:
+        """Отключает CSS анимации и переходы на текущей странице."""
+        try:
+            return bool(self.browser.execute_script(JS_NO_ANIMATIONS))
+        except Exception:
+            logging.error("Возникла ошибка в disable_animations.\n", exc_info=True)
+            return False
+
+    def wait_page_ready(self, timeout: float = None) -> bool:
+        """Ждет, пока документ не будет разобран. Нужно после get в облегченном профиле, где get не ждет load."""
+        return bool(self.wait_until(lambda: self.browser.execute_script(JS_PAGE_READY), timeout))
+
+    def wait_until(self, condition: Callable, timeout: float = None, poll: float = 0.05, poll_max: float = 0.5):
+        """
+        Опрашивает condition, пока она не вернет истинное значение, и возвращает его. По таймауту возвращает None.
+        Интервал опроса начинается с poll и растет в полтора раза до poll_max, чтобы быстро ловить
+        короткие ожидания и не долбить браузер на длинных.
+        """
+        timeout = self.time_wait if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                result = condition()
+                if result:
+                    return result
+            except Exception:
+                logging.info("Условие ожидания упало, пробую еще раз.")
+            if time.monotonic() >= deadline:
+                return None
+            time.sleep(min(poll, max(deadline - time.monotonic(), 0)))
+            poll = min(poll * 1.5, poll_max)
+
+    def wait_spinner_gone(self, xpath: str, timeout: float = None) -> bool:
+        """Ждет, пока элемент загрузки по xpath не пропадет или не станет невидимым. Возвращает True, если дождался."""
+        gone = self.wait_until(lambda: not self.browser.execute_script(JS_IS_VISIBLE, xpath), timeout)
+        if not gone:
+            logging.error(f"Элемент загрузки не исчез за отведенное время: {xpath}")
+        return bool(gone)
+
+    def wait_dom_quiet(self, quiet_ms: int = 300, timeout: float = 2, attributes: bool = False) -> bool:
+        """
+        Ждет, пока DOM страницы не перестанет меняться на quiet_ms мс(MutationObserver в браузере).
+        По умолчанию считаются только вставки, удаления узлов и текст, а смена атрибутов(крутилки, классы анимаций,
+        часы на странице) нет, и ждет не дольше 2 с: ожидание заменяет короткие паузы и не должно быть дольше них.
+        Шире(attributes=True, больший timeout) - только там, где это нужно, например при прогреве кэша.
+        Возвращает True, если страница затихла до таймаута.
+        """
+        try:
+            self.browser.set_script_timeout(timeout + 5)
+            return bool(self.browser.execute_async_script(JS_WAIT_DOM_QUIET, quiet_ms, int(timeout * 1000), attributes))
+        except Exception:
+            logging.error("Возникла ошибка в wait_dom_quiet.\n", exc_info=True)
+            return False
+
+    def wait_element_stable(self, element, timeout: float = 5) -> bool:
+        """Ждет, пока положение и размер элемента не перестанут меняться между двумя опросами(после скролла, анимации)."""
+        if element is None:
+            return False
+        last = [None]
+
+        def is_stable():
+            rect = self.browser.execute_script(JS_RECT, element)
+            stable = rect == last[0]
+            last[0] = rect
+            return stable
+
+        return bool(self.wait_until(is_stable, timeout))
+
+    def wait_windows(self, count: int, timeout: float = None) -> bool:
+        """Ждет, пока окон браузера не станет не меньше count."""
+        return bool(self.wait_until(lambda: len(self.browser.window_handles) >= count, timeout))
+
+    def enable_capture(self, patterns: dict) -> bool:
+        """
+        Включает на текущей странице перехват JSON ответов: {имя: регулярка адреса}.
+        В Chrome перехват еще ставится на каждую новую страницу до ее скриптов(CDP), поэтому переходы его не сбрасывают.
+        В Firefox режим перехвата запоминается, go_link и take_captured включают его заново после перехода,
+        а ответы, пришедшие до этого, теряются.
+        """
+        self.capture_patterns = patterns
+        self._preload_capture(patterns)
+        try:
+            return bool(self.browser.execute_script(JS_CAPTURE_INSTALL, patterns))
+        except Exception:
+            logging.error("Возникла ошибка в enable_capture.\n", exc_info=True)
+            return False
+
+    def _preload_capture(self, patterns: dict):
+        """Ставит перехват на каждую новую страницу до ее скриптов, если драйвер это умеет(Chrome, CDP)."""
+        if not hasattr(self.browser, "execute_cdp_cmd"):
+            return
+        source = f"(function () {{{JS_CAPTURE_INSTALL}}}).apply(window, [{json.dumps(patterns)}]);"
+        try:
+            if self.capture_preload is not None:
+                self.browser.execute_cdp_cmd("Page.removeScriptToEvaluateOnNewDocument", {"identifier": self.capture_preload})
+            result = self.browser.execute_cdp_cmd("Page.addScriptToEvaluateOnNewDocument", {"source": source})
+            self.capture_preload = result.get("identifier")
+        except Exception:
+            logging.error("Возникла ошибка в _preload_capture, перехват только на текущей странице.\n", exc_info=True)
+
+    def take_captured(self, name: str) -> list:
+        """
+        Забирает перехваченные с момента прошлого вызова ответы с именем name: [{'url', 'data', 'at'}, ...].
+        Если после перехода или перезагрузки перехвата на странице нет, то пишет это в лог, считает в capture_lost,
+        включает перехват заново и возвращает пустой список: ответы страницы до этого потеряны.
+        """
+        try:
+            items = self.browser.execute_script(JS_CAPTURE_TAKE, name)
+            if items is None:
+                if self.capture_patterns:
+                    self.capture_lost += 1
+                    logging.info(f"Перехват ответов пропал со страницы(переход или перезагрузка), ответы {name} до "
+                                 f"повторного включения потеряны, включаю заново. Пропадал раз: {self.capture_lost}.")
+                    self.enable_capture(self.capture_patterns)
+                return []
+            return items
+        except Exception:
+            logging.error("Возникла ошибка в take_captured.\n", exc_info=True)
+            return []
+
+    def clear_area(self, element):
+        """Очищаем текстовое поле в объекте селениума."""
+        element.clear()
+
+    def save_artifacts(self, action: str, attempt: int = 1):
+        """Снимок страницы(скриншот и DOM) в фоне через sel_artifacts, имя - тик, шаг сценария и действие, попытка."""
+        step = ".".join(part for part in (self.artifact_tags.get("step"), action) if part)
+        try:
+            sel_artifacts.capture(self.browser, step=step, attempt=attempt, tick=self.artifact_tags.get("tick"))
+        except Exception:
+            logging.error("Не смог снять страницу при ошибке.\n", exc_info=True)
+
+    def click(self, element):
+        """
+        Пробуем кликнуть по элементу с повторами по политике self.retry, повторяются только преходящие ошибки
+        (is_transient_click), на остальных сразу ElementMissingError. Снимает страницу на каждой неудачной попытке.
+        """
+        if isinstance(element, type(None)):
+            self.log_error(f"[ERR] Возникла ошибка TypeError в функции click\nЭлемента не существует! Невозможно кликнуть.")
+            logging.error("Элемента не существует! Невозможно кликнуть.\n")
+            self.failed = ElementMissingError("Элемента не существует! Невозможно кликнуть.")
+            raise self.failed
+
+        tries = 0
+
+        def attempt():
+            nonlocal tries
+            tries += 1
+            try:
+                element.click()
+            except Exception as e:
+                self.log_error(f"[ERR] Возникла неизвестная ошибка в функции click\n{getattr(e, 'msg', e)}\n{element}\n{type(e)}")
+                logging.error("Возникла неизвестная ошибка в функции click.\n", exc_info=True)
+                self.save_artifacts("click", tries)
+                raise
+
+        try:
+            self.retry.run(attempt, name="click", classify=is_transient_click)
+        except Exception as err:
+            logging.error(f"Не смог кликнуть по элементу за {tries} попыток.\n")
+            self.failed = ElementMissingError(f"Не смог кликнуть по элементу за {tries} попыток: {getattr(err, 'msg', err)}")
+            raise
+
+    def click_with_error(self, element):
+        """Использует стандартный клик селениума и попускает, если не смог. Снимает страницу, когда не смог."""
+        try:
+            if not isinstance(element, type(None)):
+                element.click()
+            else:
+                logging.error("Элемента не существует! Невозможно кликнуть.\n")
+                raise TypeError("Элемента не существует! Невозможно кликнуть.")
+        except TypeError as e:
+            self.log_error(f"[ERR] Возникла ошибка TypeError в функции click\n{e}\n{locals()}")
+            logging.error("Элемента не существует! Невозможно кликнуть.\n", exc_info=True)
+            self.failed = ElementMissingError(str(e))
+            raise self.failed from e
+        except ElementClickInterceptedException as err:
+            logging.error("[click_with_error] Ошибка клика по элементу, потому что что-то мешает или вроде того.\n", exc_info=True)
+            raise ElementClickInterceptedException("[click_with_error] Не смог кликнуть по элементу")
+        except Exception as e:
+            self.log_error(f"[ERR] Возникла неизвестная ошибка в функции click_with_error\n{e.msg}\n{element}\n{type(e)}")
+            logging.error("Возникла неизвестная ошибка в функции click_with_error.\n", exc_info=True)
+            self.save_artifacts("click_with_error")
+            self.wait_dom_quiet()
+
+    def raise_if_failed(self):
+        """Поднимает ElementMissingError, которую click проглотившего её метода запомнил, и сбрасывает её."""
+        failed, self.failed = self.failed, None
+        if failed is not None:
+            raise failed
+
+    def clear_failed(self):
+        """
+        Забывает запомненную ElementMissingError. Вызывается в начале шага или направления, чтобы ошибка, оставшаяся
+        от прошлого(например, клик по закрытию после удачной записи), не подняла raise_if_failed в следующем.
+        """
+        self.failed = None
+
+    def ex_sc(self, script_on_element: str):
+        """
+        Проверка загрузки элемена в DOM для execute_script по тексту JS элемента.
+        Повторяет по политике self.retry, пока скрипт возвращает None или падает на еще не загруженном элементе.
+        """
+        try:
+            element, _ = self.retry.run(
+                self.browser.execute_script, script_on_element,
+                name="ex_sc", classify=is_js_not_loaded, accept=lambda result: result is not None)
+            return element
+        except Exception:
+            logging.error("Возникла неизвестная ошибка в функции ex_sc.\n", exc_info=True)
+
+    def ex_sc_on_element(self, element, script_on_element: str):
+        """Применяет JS скрипт на переданном элементе, повторяет по политике self.retry, пока элемент не загрузится."""
+        try:
+            self.retry.run(self.browser.execute_script, script_on_element, element, name="ex_sc_on_element", classify=is_js_not_loaded)
+        except Exception:
+            logging.error("Возникла неизвестная ошибка в функции ex_sc_on_element.\n", exc_info=True)
+
+    def elem_vis(self, xpath: str):
+        """Ожидает элемент на отображение."""
+        try:
+            element = WebDriverWait(self.browser, self.time_wait).until(
+                EC.visibility_of_element_located((By.XPATH, xpath))
+            )
+            if element:
+                return True
+            return False
+        except TypeError as e:
+            self.log_error(f"[ERR] Элемент не появился. Ошибка TypeError в  elem_vis \n{e}")
+            logging.error("Элемент не появился. Ошибка TypeError в  elem_vis \n", exc_info=True)
+        except TimeoutException:
+            self.log_error("[ERR] Элемент не появился. Ошибка TimeoutException в  elem_vis \n")
+            logging.error("Элемент не появился. Ошибка TimeoutException в  elem_vis.\n", exc_info=True)
+        except Exception as e:
+            self.log_error("[ERR] Элемент не появился. Ошибка Exception в  elem_vis\n")
+            logging.error("Элемент не появился. Ошибка Exception в  elem_vis.\n", exc_info=True)
+            self.log_error(type(e))
+            self.log_error(f"{e.msg}")
+            time.sleep(2)
+
+    def elem_vis_with_timeout(self, xpath: str):
+        """Ожидает элемент на отображение с ошибкой по таймауту."""
+        try:
+            WebDriverWait(self.browser, self.time_wait).until(
+                EC.visibility_of_element_located((By.XPATH, xpath))
+            )
+        except TimeoutException:
+            raise TimeoutException
+        except Exception as e:
+            self.log_error(f"[ERR] Возникла ошибка elem_vis_with_timeout\n{e}")
+            logging.error("Возникла ошибка elem_vis_with_timeout.\n", exc_info=True)
+            time.sleep(2)
+
+    def elem_invis(self, xpath: str):
+        """Ожидает элемент на исчезновение."""
+        try:
+            WebDriverWait(self.browser, self.time_wait).until(
+                EC.invisibility_of_element_located((By.XPATH, xpath))
+            )
+        except Exception as e:
+            self.log_error(f"[ERR] Возникла ошибка elem_invis\n{e}")
+            logging.error("Возникла ошибка elem_invis.\n", exc_info=True)
+            time.sleep(2)
+
+    def elem_clickable(self, xpath: str):
+        """Ожидает элемент на клик."""
+        try:
+            WebDriverWait(self.browser, self.time_wait).until(
+                EC.element_to_be_clickable((By.XPATH, xpath))
+            )
+        except Exception as e:
+            self.log_error(f"[ERR] Возникла ошибка elem_clickable\n{e}")
+            logging.error("Возникла ошибка elem_clickable.\n", exc_info=True)
+            time.sleep(2)
+
+    def elem_to_be_clickable(self, xpath):
+        """Ожидаем элемент на клик и возвращает True если может кликнуть."""
+        try:
+            WebDriverWait(self.browser, self.time_wait).until(
+                EC.element_to_be_clickable((By.XPATH, xpath))
+            )
+            return True
+        except Exception as e:
+            self.log_error(f"[ERR] Возникла ошибка elem_clickable\n{e}")
+            logging.error("Возникла ошибка в elem_to_be_clickable, по элементу нельзя кликнуть.\n", exc_info=True)
+            time.sleep(2)
+            return False
+
+    def find_id(self, text: str):
+        """Находит элемент по id и возвращает его."""
+        self.browser.implicitly_wait(15)
+        try:
+            search = self.browser.find_element("id", text)
+            return search
+        except Exception as e:
+            self.log_error(f"[ERR] Возникла ошибка find_id \n{e}")
+            logging.error("Возникла ошибка find_id.\n", exc_info=True)
+            time.sleep(2)
+            self.quit()
+
+    def find_xpath(self, xpath: str):
+        """
+        Ждет пока по элементу можно кликнуть и возвращает его.
+        Если ожидание вернуло None или элемент не нашелся, перерисовался или не дождался(is_transient_lookup),
+        то повторяет по политике self.retry. Всего поиск идет не дольше большего из time_wait и deadline политики:
+        первая попытка ждет time_wait, повторы - только оставшееся время.
+        """
+        limit = time.monotonic() + max(self.time_wait, self.retry.deadline)
+
+        def wait_clickable():
+            timeout = min(self.time_wait, limit - time.monotonic())
+            if timeout <= 0:
+                raise TimeoutException(f"Время поиска {xpath} вышло")
+            return WebDriverWait(self.browser, timeout).until(
+                EC.element_to_be_clickable((By.XPATH, xpath))
+            )
+
+        try:
+            search, attempts = self.retry.run(
+                wait_clickable, name="find_xpath", classify=is_transient_lookup, accept=lambda result: result is not None)
+            if isinstance(search, type(None)):
+                self.log_error(f"[ERR] Объекты None после {attempts} попыток\n{xpath}")
+                logging.error("Возникла ошибка Объекты None.\n")
+            return search
+        except Exception as e:
+            self.log_error(f"[ERR] Возникла ошибка в фунции find_xpath \n{getattr(e, 'msg', e)}")
+            logging.error("Возникла ошибка find_xpath.\n", exc_info=True)
+            return None
+
+    def find_xpath_elements(self, xpath: str):
+        """Вернуть список элементов по xpath."""
+        try:
+            search = self.browser.find_elements(by=By.XPATH, value=xpath)
+            return search
+        except Exception as e:
+            self.log_error(f"[ERR] Возникла ошибка find_xpa_elements\n{e}")
+            logging.error("Возникла ошибка find_xpa_elements.\n", exc_info=True)
+            time.sleep(2)
+
+    def go_link(self):
+        """Метод перехода по ссылке."""
+        try:
+            self.browser.get(self.link)
+            if self.lean:
+                self.wait_page_ready()
+                self.disable_animations()
+            if self.capture_patterns and self.capture_preload is None:
+                logging.info("Переход по ссылке сбросил перехват ответов, включаю заново.")
+                self.enable_capture(self.capture_patterns)
+        except Exception as e:
+            self.log_error(f"[ERR] Возникла ошибка go_link\n{e}")
+            logging.error("Возникла ошибка go_link.\n", exc_info=True)
+            time.sleep(2)
+            self.quit()
+
+    def quit(self):
+        """Закрывает браузер."""
+        self.browser.quit()
+
+    def scroll(self, obj):
+        """Скрол на странице до элемента методом JS arguments[0].scrollIntoView({block: 'center', inline: 'center'})."""
+        self.browser.execute_script(
+            #"return arguments[0].scrollIntoView(true);",
+            "arguments[0].scrollIntoView({block: 'center', inline: 'center'});",
+            obj
+            )
+
+    def send_text(self, element, text: str):
+        """Отправляет текст в указанный элемент."""
+        element.send_keys(text)
+
+
+def make_browser(name: str = "firefox", **kwargs) -> BaseSeleniumBrow:
+    """
+    Создает SeleniumBrow нужного браузера по имени из BROWSERS, остальные аргументы передаются в конструктор.
+    Модуль браузера импортируется только здесь, поэтому для Firefox не нужен chromedriver и наоборот.
+    """
+    module = BROWSERS.get(name.lower())
+    if module is None:
+        raise ValueError(f"Неизвестный браузер {name}, доступны: {', '.join(BROWSERS)}")
+    return import_module(module).SeleniumBrow(**kwargs)
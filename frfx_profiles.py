@@ -0,0 +1,310 @@
+"""
+Шаблонный профиль Firefox: расширения установлены насовсем, настройки записаны в user.js, кэш прогрет страницами
+сайта. Шаблон при сборке один раз запускается в безголовом Firefox, чтобы тот зарегистрировал расширения
+(extensions.json) и собрал кэш запуска, поэтому клоны не тратят на это время. Каждый новый браузер запускается
+с клона шаблона(clone_profile): файлы расширений в клоне - жесткие ссылки на шаблон(Firefox их не меняет), остальное,
+в том числе кэш(cache2, его записи и индекс Firefox переписывает на месте), копируется.
+Клоны, чей процесс уже завершился, удаляются при создании следующего клона и командой clean.
+Шаблон пересобирается сам, если поменялись файлы расширений или настройки(сверяется хэш из manifest.json), или руками:
+    python frfx_profiles.py rebuild [адрес для прогрева кэша]
+    python frfx_profiles.py status
+    python frfx_profiles.py clean
+Папка профилей - FRFX_PROFILES_DIR, по умолчанию profiles рядом с этим файлом.
+"""
+
+from datetime import datetime as d
+import hashlib
+import json
+import logging
+import os
+import os.path
+import shutil
+import stat
+import sys
+import tempfile
+import time
+import zipfile
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+PROFILES_DIR = os.getenv("FRFX_PROFILES_DIR", os.path.join(BASE_DIR, "profiles"))
+TEMPLATE_DIR = os.path.join(PROFILES_DIR, "template")
+CLONES_DIR = os.path.join(PROFILES_DIR, "clones")
+MANIFEST = "manifest.json"
+
+# Расширения, которые раньше ставились install_addon при каждом запуске с is_frk=True.
+EXTENSIONS = [
+    os.path.join(BASE_DIR, "extensions", "ru.cryptopro.nmcades@cryptopro.ru.xpi"),
+    os.path.join(BASE_DIR, "extensions", "pbafkdcnd@ngodfeigfdgiodgnmbgcfha.ru.xpi"),
+]
+
+# Настройки шаблона: без стартовых страниц, обновлений и телеметрии, расширения из папки профиля включены сразу,
+# кэш на диске большой и не ужимается сам.
+TEMPLATE_PREFS = {
+    "browser.shell.checkDefaultBrowser": False,
+    "browser.startup.homepage_override.mstone": "ignore",
+    "browser.aboutwelcome.enabled": False,
+    "startup.homepage_welcome_url": "about:blank",
+    "app.update.auto": False,
+    "app.update.checkInstallTime": False,
+    "datareporting.policy.dataSubmissionEnabled": False,
+    "toolkit.telemetry.reportingpolicy.firstRun": False,
+    "extensions.autoDisableScopes": 0,
+    "extensions.enabledScopes": 15,
+    "extensions.update.enabled": False,
+    "browser.cache.disk.enable": True,
+    "browser.cache.disk.smart_size.enabled": False,
+    "browser.cache.disk.capacity": 262144,
+}
+
+# Клон, по имени которого не понять, чей он, считается брошенным, если он старше стольких часов.
+CLONE_MAX_AGE_HOURS = 12
+
+
+def extension_id(path: str) -> str:
+    """Id расширения из manifest.json внутри xpi, если его там нет - имя файла без .xpi."""
+    try:
+        with zipfile.ZipFile(path) as xpi:
+            manifest = json.loads(xpi.read("manifest.json").decode("utf-8-sig"))
+        for key in ("browser_specific_settings", "applications"):
+            gecko_id = manifest.get(key, {}).get("gecko", {}).get("id")
+            if gecko_id:
+                return gecko_id
+    except (OSError, KeyError, ValueError, zipfile.BadZipFile):
+        logging.info(f"Не смог прочитать id расширения из {path}, беру имя файла.")
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def template_hash(extensions: list = None, prefs: dict = None) -> str:
+    """Хэш того, из чего собран шаблон: содержимое файлов расширений и настройки."""
+    digest = hashlib.sha256()
+    for path in sorted(extensions if extensions is not None else EXTENSIONS):
+        if os.path.exists(path):
+            digest.update(os.path.basename(path).encode("utf-8"))
+            with open(path, "rb") as file:
+                for chunk in iter(lambda: file.read(1 << 20), b""):
+                    digest.update(chunk)
+    digest.update(json.dumps(prefs if prefs is not None else TEMPLATE_PREFS, sort_keys=True).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def read_manifest(path: str = TEMPLATE_DIR) -> dict:
+    """manifest.json шаблона или пустой словарь, если шаблона нет."""
+    try:
+        with open(os.path.join(path, MANIFEST), encoding="utf-8") as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+
+def has_extension(profile: str, path: str) -> bool:
+    """Стоит ли расширение из файла path в профиле profile(лежит ли extensions/<id>.xpi)."""
+    return os.path.exists(os.path.join(profile, "extensions", f"{extension_id(path)}.xpi"))
+
+
+def is_template_current() -> bool:
+    """Есть ли шаблон и собран ли он из текущих расширений и настроек."""
+    return read_manifest().get("hash") == template_hash()
+
+
+def _write_user_js(path: str, prefs: dict):
+    """Записывает настройки в user.js профиля, Firefox применяет его при каждом запуске."""
+    lines = [f'user_pref("{name}", {json.dumps(value)});' for name, value in prefs.items()]
+    with open(os.path.join(path, "user.js"), "w", encoding="utf-8") as file:
+        file.write("\n".join(lines) + "\n")
+
+
+def _first_run(path: str, urls: list = None):
+    """
+    Первый запуск безголового Firefox с профилем path: Firefox регистрирует расширения из папки профиля
+    (extensions.json) и пишет кэш запуска. При urls еще открывает адреса, чтобы статика сайта осела в кэше профиля.
+    """
+    from frfx_hlss_sel_cls import SeleniumBrow
+
+    sel = SeleniumBrow(link=urls[0] if urls else "about:blank", headless=True, profile=path)
+    try:
+        registry = os.path.join(path, "extensions.json")
+        if not sel.wait_until(lambda: os.path.exists(registry), timeout=30):
+            logging.info("Firefox не записал extensions.json за 30 с, клоны зарегистрируют расширения сами.")
+        for url in urls or []:
+            logging.info(f"Прогреваю кэш шаблона: {url}")
+            sel.link = url
+            sel.go_link()
+            sel.wait_page_ready(timeout=60)
+            sel.wait_dom_quiet(quiet_ms=1000, timeout=30)
+    finally:
+        sel.quit()
+
+
+def _on_rm_error(func, path, exc_info):
+    """Для shutil.rmtree: файл только для чтения(на Windows такой не удалить) делает записываемым и повторяет."""
+    try:
+        os.chmod(path, stat.S_IWRITE | stat.S_IREAD)
+        func(path)
+    except OSError:
+        pass
+
+
+def _remove_tree(path: str):
+    """Удаляет папку профиля вместе с файлами только для чтения, ошибки пропускает."""
+    shutil.rmtree(path, onerror=_on_rm_error)
+
+
+def build_template(warm_urls: list = None, extensions: list = None, prefs: dict = None) -> str:
+    """
+    Собирает шаблон во временной папке и подменяет им старый: расширения в extensions/<id>.xpi, настройки в user.js,
+    первый запуск Firefox, а при warm_urls в нем же прогрев кэша. Возвращает путь к шаблону.
+    """
+    extensions = EXTENSIONS if extensions is None else extensions
+    prefs = TEMPLATE_PREFS if prefs is None else prefs
+    os.makedirs(PROFILES_DIR, exist_ok=True)
+    building = tempfile.mkdtemp(prefix="template-", dir=PROFILES_DIR)
+    try:
+        os.makedirs(os.path.join(building, "extensions"))
+        installed = []
+        for path in extensions:
+            if not os.path.exists(path):
+                logging.info(f"Файла расширения {path} нет, собираю шаблон без него.")
+                continue
+            target = os.path.join(building, "extensions", f"{extension_id(path)}.xpi")
+            shutil.copy2(path, target)
+            installed.append(os.path.basename(target))
+        _write_user_js(building, prefs)
+        _first_run(building, warm_urls)
+        manifest = {
+            "hash": template_hash(extensions, prefs),
+            "built": d.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "extensions": installed,
+            "warm_urls": warm_urls or [],
+        }
+        with open(os.path.join(building, MANIFEST), "w", encoding="utf-8") as file:
+            json.dump(manifest, file, ensure_ascii=False, indent=2)
+
+        old = None
+        if os.path.exists(TEMPLATE_DIR):
+            old = f"{TEMPLATE_DIR}.old-{os.getpid()}"
+            os.rename(TEMPLATE_DIR, old)
+        os.rename(building, TEMPLATE_DIR)
+        if old is not None:
+            _remove_tree(old)
+        logging.info(f"Шаблон профиля собран: {TEMPLATE_DIR}, расширения: {installed}")
+        return TEMPLATE_DIR
+    except Exception:
+        _remove_tree(building)
+        raise
+
+
+def ensure_template(warm_urls: list = None) -> str:
+    """Возвращает путь к шаблону, собирая его, если шаблона нет или расширения/настройки поменялись."""
+    if not is_template_current():
+        logging.info("Шаблона профиля нет или он устарел, собираю заново.")
+        build_template(warm_urls=warm_urls or read_manifest().get("warm_urls"))
+    return TEMPLATE_DIR
+
+
+def _link_or_copy(source: str, target: str):
+    """
+    Файлы расширений не меняются, их можно делить с шаблоном жесткой ссылкой, иначе(другой диск) - копия.
+    Остальное, в том числе кэш, только копия: Firefox клона переписывает эти файлы на месте.
+    """
+    if source.endswith(".xpi"):
+        try:
+            os.link(source, target)
+            return target
+        except OSError:
+            pass
+    return shutil.copy2(source, target)
+
+
+def clone_profile() -> str:
+    """
+    Делает клон шаблона для одного браузера и возвращает путь к нему. Lock файлы запущенного Firefox не копируются.
+    Клон удаляется remove_clone после закрытия браузера, а клоны упавших процессов - здесь же, перед новым клоном.
+    """
+    template = ensure_template()
+    os.makedirs(CLONES_DIR, exist_ok=True)
+    removed = clean_clones()
+    if removed:
+        logging.info(f"Удалено брошенных клонов профиля: {removed}.")
+    clone = tempfile.mkdtemp(prefix=f"{os.getpid()}-", dir=CLONES_DIR)
+    os.rmdir(clone)
+    shutil.copytree(
+        template, clone,
+        copy_function=_link_or_copy,
+        ignore=shutil.ignore_patterns("lock", ".parentlock", "parent.lock", MANIFEST))
+    return clone
+
+
+def remove_clone(path: str):
+    """Удаляет клон профиля. Шаблон так удалить нельзя."""
+    if path and os.path.dirname(os.path.abspath(path)) == os.path.abspath(CLONES_DIR):
+        _remove_tree(path)
+
+
+def _pid_alive(pid: int) -> bool:
+    """Жив ли процесс с номером pid."""
+    if pid <= 0:
+        return False
+    if os.name == "nt":
+        import ctypes
+
+        kernel32 = ctypes.windll.kernel32
+        handle = kernel32.OpenProcess(0x1000, False, pid)  # PROCESS_QUERY_LIMITED_INFORMATION
+        if not handle:
+            return False
+        try:
+            code = ctypes.c_ulong()
+            return bool(kernel32.GetExitCodeProcess(handle, ctypes.byref(code))) and code.value == 259  # STILL_ACTIVE
+        finally:
+            kernel32.CloseHandle(handle)
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def clean_clones(max_age_hours: float = CLONE_MAX_AGE_HOURS) -> int:
+    """
+    Удаляет брошенные клоны: те, чей процесс(номер в начале имени клона) уже завершился. Клоны живых процессов
+    не трогаются, сколько бы они ни работали, а клоны без номера процесса в имени - если старше max_age_hours часов.
+    Возвращает, сколько удалено.
+    """
+    if not os.path.isdir(CLONES_DIR):
+        return 0
+    removed = 0
+    border = time.time() - max_age_hours * 3600
+    for name in os.listdir(CLONES_DIR):
+        path = os.path.join(CLONES_DIR, name)
+        owner = name.split("-", 1)[0]
+        if owner.isdigit():
+            abandoned = int(owner) != os.getpid() and not _pid_alive(int(owner))
+        else:
+            abandoned = os.path.getmtime(path) < border
+        if abandoned:
+            _remove_tree(path)
+            removed += 1
+    return removed
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    args = sys.argv
+    if len(args) == 1 or args[1] == 'help':
+        print(
+            '-- Для пересборки шаблона профиля передайте rebuild и, если нужно, адреса для прогрева кэша.\n'
+            '-- Для проверки, актуален ли шаблон, передайте status.\n'
+            '-- Для удаления брошенных клонов профиля передайте clean.\n'
+            )
+    elif args[1] == 'rebuild':
+        print(f'Шаблон профиля собран: {build_template(warm_urls=args[2:] or read_manifest().get("warm_urls"))}')
+    elif args[1] == 'status':
+        manifest = read_manifest()
+        if not manifest:
+            print('Шаблона профиля нет.')
+        else:
+            state = 'актуален' if is_template_current() else 'устарел, расширения или настройки поменялись'
+            print(f'Шаблон собран {manifest["built"]}, {state}. Расширения: {", ".join(manifest["extensions"]) or "нет"}.')
+    elif args[1] == 'clean':
+        print(f'Удалено брошенных клонов: {clean_clones()}.')
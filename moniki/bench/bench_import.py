@@ -0,0 +1,96 @@
+"""
+Замер холодного старта: сколько стоит запуск команд moniki_bd.py и импорт moniki.py до запуска браузера.
+Каждый сценарий запускается отдельным процессом python -X importtime, время импортов берется из его отчета,
+общее время - по часам процесса-замерщика. Берется лучший из --repeat запусков, чтобы не мерить шум диска.
+Если сценарий не уложился в бюджет, то код выхода 1, поэтому замер можно ставить проверкой перед выкладкой.
+    python bench_import.py --repeat 5
+    python bench_import.py --budget "moniki_bd help=150" --budget "import moniki=250"
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+MONIKI_DIR = os.path.dirname(BENCH_DIR)
+MAIN_DIR = os.path.dirname(MONIKI_DIR)
+
+# Сценарий: аргументы python после -X importtime.
+SCENARIOS = {
+    "moniki_bd help": [os.path.join(MONIKI_DIR, "moniki_bd.py"), "help"],
+    "import moniki": ["-c", "import moniki"],
+    "Sel до запуска браузера": [
+        "-c",
+        "import moniki, base_sel_cls, frfx_hlss_sel_cls as frfx; frfx.SeleniumBrow.make_options(headless=True, lean=True)",
+    ],
+}
+# Бюджет общего времени сценария, мс.
+BUDGETS_MS = {
+    "moniki_bd help": 150,
+    "import moniki": 250,
+    "Sel до запуска браузера": 1500,
+}
+
+
+def parse_importtime(stderr: str) -> list:
+    """
+    Разбирает отчет -X importtime в список импортов верхнего уровня [(модуль, мкс с вложенными), ...].
+    Строки отчета: 'import time:   self [us] |  cumulative | imported package', вложенность - отступом в имени.
+    """
+    top = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not name.startswith("  "):
+            top.append((name.strip(), int(cumulative)))
+    return top
+
+
+def run_scenario(args: list) -> tuple:
+    """Один запуск сценария: (общее время, мс; импорты верхнего уровня)."""
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([MONIKI_DIR, MAIN_DIR]))
+    started = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", *args],
+        cwd=MONIKI_DIR, env=env, capture_output=True, text=True, encoding="utf-8")
+    spent = (time.perf_counter() - started) * 1000
+    if result.returncode != 0:
+        errors = "\n".join(line for line in result.stderr.splitlines() if not line.startswith("import time:"))
+        raise RuntimeError(f"Сценарий {args} упал:\n{errors[-2000:]}")
+    return spent, parse_importtime(result.stderr)
+
+
+def run(repeat: int, budgets: dict, top: int) -> bool:
+    """Прогоняет все сценарии, печатает время и самые тяжелые импорты. Возвращает True, если все в бюджете."""
+    ok = True
+    for name, args in SCENARIOS.items():
+        try:
+            runs = [run_scenario(args) for _ in range(repeat)]
+        except RuntimeError as err:
+            print(f"{name:<28} ошибка запуска\n{err}")
+            ok = False
+            continue
+        spent, imports = min(runs, key=lambda item: item[0])
+        budget = budgets.get(name)
+        status = "ok" if budget is None or spent <= budget else "ПРЕВЫШЕН"
+        ok = ok and status == "ok"
+        print(f"{name:<28} {spent:>8.1f} мс  импорты {sum(us for _, us in imports) / 1000:>7.1f} мс  бюджет {budget} мс  {status}")
+        for module, us in sorted(imports, key=lambda item: item[1], reverse=True)[:top]:
+            print(f"    {module:<40} {us / 1000:>7.1f} мс")
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Замер холодного старта moniki_bd.py и moniki.py по -X importtime.")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=5, help="сколько самых тяжелых импортов показать")
+    parser.add_argument("--budget", action="append", default=[], help='бюджет сценария "имя=мс", можно несколько')
+    args = parser.parse_args()
+    budgets = dict(BUDGETS_MS)
+    for item in args.budget:
+        name, value = item.rsplit("=", 1)
+        budgets[name.strip()] = float(value)
+    sys.exit(0 if run(args.repeat, budgets, args.top) else 1)
@@ -0,0 +1,63 @@
+"""
+Замер того, сколько времени потоку скрипта стоит логирование в обычном режиме и в режиме очереди(MONIKI_QUEUE_LOG=1).
+Имитирует тик: lines строк logging.info(как у каждого действия в moniki.py), каждая errors_every строка - log_any_error,
+и один снимок страницы на тик. Время считается только для потока скрипта, фоновая запись в файлы не входит.
+    python bench_logging.py --lines 3000 --ticks 5
+"""
+
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+
+MAIN_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, MAIN_DIR)
+
+import base_sel_cls as base  # noqa: E402
+
+PAGE = "<html>" + "<div class='cell'>Иванов И.И.</div>" * 5000 + "</html>"
+
+
+def simulate_tick(lines: int, errors_every: int, work_dir: str):
+    """Логирование одного тика так, как его делает moniki.py."""
+    for number in range(lines):
+        logging.info(f"Нахожу элемент с последней ячейкой. {number}")
+        if number % errors_every == 0:
+            base.log_any_error(f"[ERR] Возникла ошибка в фунции find_xpath \nэлемент {number}")
+    base.save_snapshot(os.path.join(work_dir, "foo.html"), PAGE)
+
+
+def measure(queued: bool, lines: int, errors_every: int, ticks: int) -> float:
+    """Возвращает среднее время тика в секундах для потока скрипта."""
+    work_dir = tempfile.mkdtemp(prefix="moniki_bench_log_")
+    base.BASE_DIR = work_dir
+    logging.basicConfig(
+        level=logging.INFO,
+        filename=os.path.join(work_dir, "moniki_class.log"),
+        filemode="w",
+        format="%(asctime)s %(levelname)s %(message)s",
+        force=True)
+    if queued:
+        base.enable_queue_logging()
+    spent = 0
+    for _ in range(ticks):
+        start = time.perf_counter()
+        simulate_tick(lines, errors_every, work_dir)
+        spent += time.perf_counter() - start
+    base.disable_queue_logging()
+    return spent / ticks
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Замер логирования скрипта по МОНИКИ: обычный режим против очереди.")
+    parser.add_argument("--lines", type=int, default=3000, help="строк logging.info за тик")
+    parser.add_argument("--errors-every", type=int, default=50, help="каждая какая строка дополнительно идет в log_any_error")
+    parser.add_argument("--ticks", type=int, default=5)
+    args = parser.parse_args()
+    sync = measure(False, args.lines, args.errors_every, args.ticks)
+    queued = measure(True, args.lines, args.errors_every, args.ticks)
+    print(f"Обычное логирование: {sync * 1000:.1f} мс на тик")
+    print(f"Очередь:             {queued * 1000:.1f} мс на тик")
+    print(f"Экономия:            {(sync - queued) * 1000:.1f} мс на тик ({(1 - queued / sync) * 100:.0f}%)")
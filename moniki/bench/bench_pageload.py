@@ -0,0 +1,83 @@
+"""
+Замер загрузки страниц локальной заглушки ЕМИАС(stand/server.py) в безголовых браузерах с обычным и облегченным
+профилем SeleniumBrow(lean=True: без картинок, шрифтов, анимаций и сторонних счетчиков, page_load_strategy eager).
+Время страницы - от get до нашей проверки готовности: документ разобран и нужный элемент есть на странице.
+Браузеры сравниваются на одних и тех же страницах, чтобы выбрать более быстрый(MONIKI_BROWSER).
+    python bench_pageload.py --repeat 10 --latency 300 --browsers firefox,chrome
+"""
+
+import argparse
+import os
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+MONIKI_DIR = os.path.dirname(BENCH_DIR)
+MAIN_DIR = os.path.dirname(MONIKI_DIR)
+sys.path.insert(0, MAIN_DIR)
+sys.path.insert(0, MONIKI_DIR)
+sys.path.insert(0, os.path.join(MONIKI_DIR, "stand"))
+
+# Страница заглушки и xpath элемента, появление которого считается готовностью.
+PAGES = {
+    "portal.html": '//a[@class="menu-directions"]',
+    "index.html": '//*[@id="Login"]',
+    "directions.html": '//button[@class="search-button"]',
+}
+
+
+def measure(port: int, browser: str, lean: bool, repeat: int) -> dict:
+    """Открывает каждую страницу repeat раз в одном браузере и возвращает {страница: [секунды, ...]}."""
+    import base_sel_cls as base
+
+    sel = base.make_browser(browser, link=f"http://127.0.0.1:{port}/", headless=True, lean=lean)
+    result = {}
+    try:
+        for page, xpath in PAGES.items():
+            url = f"http://127.0.0.1:{port}/{page}"
+            for _ in range(repeat):
+                started = time.perf_counter()
+                sel.browser.get(url)
+                sel.wait_page_ready()
+                sel.wait_until(lambda: sel.browser.execute_script(base.JS_IS_VISIBLE, xpath), timeout=30)
+                result.setdefault(page, []).append(time.perf_counter() - started)
+    finally:
+        sel.quit()
+    return result
+
+
+def run(port: int, latency: int, repeat: int, browsers: list):
+    """Замер каждого браузера без облегченного профиля и с ним на одной заглушке, затем отчет p50/p95 по страницам."""
+    from server import serve_in_thread
+    from moniki_timing import percentile
+
+    os.environ["FRFX_BLOCK_HOSTS"] = "counter.stand.test"
+    # Сравниваются именно Chrome и Firefox, поэтому Chrome не подменяется Firefox на Linux.
+    os.environ["SEL_CHROME_ON_LINUX"] = "1"
+    server = serve_in_thread(port, latency)
+    try:
+        results = {
+            (browser, lean): measure(port, browser, lean, repeat)
+            for browser in browsers
+            for lean in (False, True)
+        }
+    finally:
+        server.shutdown()
+
+    print(f"Повторов: {repeat}, задержка заглушки: {latency} мс")
+    print(f"{'Страница':<20} {'браузер':<10} {'профиль':<10} {'p50':>8} {'p95':>8}")
+    for page in PAGES:
+        for (browser, lean), result in results.items():
+            values = sorted(result[page])
+            name = "lean" if lean else "обычный"
+            print(f"{page:<20} {browser:<10} {name:<10} {percentile(values, 0.5):>8.3f} {percentile(values, 0.95):>8.3f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Замер загрузки страниц с обычным и облегченным профилем браузера.")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--latency", type=int, default=300, help="задержка ответов заглушки и ее файлов, мс")
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--browsers", default="firefox", help="браузеры через запятую: firefox,chrome")
+    args = parser.parse_args()
+    run(args.port, args.latency, args.repeat, args.browsers.split(","))
@@ -0,0 +1,106 @@
+"""
+Замер скорости скрипта по МОНИКИ на локальной заглушке ЕМИАС(stand/server.py) в безголовом Firefox.
+Поднимает заглушку, создает временную БД с направлениями, запускает фазы main(): вход, сбор талонов и запись,
+и печатает время по фазам и шагам Sel(из moniki_timing) и общее количество команд WebDriver.
+    python bench_stand.py --ticks 3 --directions 10 --latency 300
+Локаторы в moniki.py в публичной версии скрыты, для замеров туда нужно вернуть рабочие, разметка заглушки
+повторяет тексты и классы страниц ЕМИАС.
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+MONIKI_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, MONIKI_DIR)
+sys.path.insert(0, os.path.join(MONIKI_DIR, "stand"))
+
+
+def prepare_env(port: int, work_dir: str):
+    """Переменные окружения для moniki.py, задаются до его импорта."""
+    os.environ["EMIAS_LINK"] = f"http://127.0.0.1:{port}/index.html"
+    os.environ["EMIPLOG"] = "bench"
+    os.environ["EMIPPASS"] = "bench"
+    os.environ["DIRECTION_FOR_GET_TALONS"] = "0000000"
+    os.environ["MONIKI_WORKERS"] = "1"
+    os.environ["MONIKI_TIMING"] = "1"
+    os.environ["MONIKI_TIMING_FILE"] = os.path.join(work_dir, "timing.jsonl")
+
+
+def prepare_db(bd, path: str, directions: int):
+    """Создает временную БД с таблицами МОНИКИ и directions не записанными направлениями."""
+    from server import SPECIALTIES
+
+    bd.PATH_DB = path
+    getattr(bd, "__create_table_specialties")()
+    getattr(bd, "__create_table_data")()
+    getattr(bd, "__create_table_records")()
+    bd.migrate()
+    for spec in SPECIALTIES:
+        bd.put_specialty(spec, 0)
+    for number in range(directions):
+        bd.put_record(f"5000{number:03d}", SPECIALTIES[number % len(SPECIALTIES)], 0)
+
+
+def count_commands(browser) -> dict:
+    """Подменяет отправку команд WebDriver на счетчик и возвращает словарь {команда: количество}."""
+    counts = {}
+    executor = browser.command_executor
+    execute = executor.execute
+
+    def counting(command, params):
+        counts[command] = counts.get(command, 0) + 1
+        return execute(command, params)
+
+    executor.execute = counting
+    return counts
+
+
+def run(port: int, latency: int, directions: int, ticks: int):
+    """Один прогон замера: вход и ticks тиков, затем отчет."""
+    from server import serve_in_thread
+
+    work_dir = tempfile.mkdtemp(prefix="moniki_bench_")
+    prepare_env(port, work_dir)
+    server = serve_in_thread(port, latency)
+
+    import moniki
+    import moniki_bd as bd
+    import moniki_timing as timing
+
+    prepare_db(bd, os.path.join(work_dir, "data.db"), directions)
+    started = time.perf_counter()
+    s = moniki.Sel()
+    counts = count_commands(s.sel.browser)
+    try:
+        timing.start_tick()
+        with timing.span("main.login"):
+            s.log_in_and_open_directions()
+        for _ in range(ticks):
+            timing.start_tick()
+            moniki.tick(s)
+    finally:
+        s.sel.quit()
+        timing.flush()
+        server.shutdown()
+    total = time.perf_counter() - started
+
+    print(f"Всего: {total:.2f} с, тиков: {ticks}, направлений: {directions}, задержка заглушки: {latency} мс")
+    print(f"Команд WebDriver: {sum(counts.values())}")
+    for command, count in sorted(counts.items(), key=lambda item: item[1], reverse=True)[:10]:
+        print(f"    {command:<35} {count:>6}")
+    print()
+    timing.print_summary(timing.timing_file())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Замер скрипта по МОНИКИ на локальной заглушке ЕМИАС.")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=int, default=300, help="задержка JSON ответов заглушки, мс")
+    parser.add_argument("--directions", type=int, default=10, help="сколько не записанных направлений положить в БД")
+    parser.add_argument("--ticks", type=int, default=3)
+    args = parser.parse_args()
+    run(args.port, args.latency, args.directions, args.ticks)
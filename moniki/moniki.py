@@ -4,18 +4,18 @@
 """
 
 import datetime
+import functools
 import logging
 import os
 import os.path
 import time
-from typing import Union
-
-from dotenv import load_dotenv
-from selenium.common.exceptions import SessionNotCreatedException, TimeoutException
-import schedule
-from plyer import notification
+from typing import Callable, Union
 
 import moniki_bd as bd
+import moniki_flow as flow
+import moniki_session as session
+import moniki_timing as timing
+import moniki_workers as workers
 
 __version__ = "1.0.0"
 __author__ = "DinoWithPython"
@@ -23,21 +23,125 @@ __copyright__ = "2024, ГБУЗ Мытищинская ОКБ"
 __contact__ = "<email: pa.dmi@rambler.ru>"
 
 MAIN_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-load_dotenv()
 
 path = MAIN_DIR.split("\\")
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-DIRECTION_FOR_GET_TALONS = os.getenv("DIRECTION_FOR_GET_TALONS")
+def load_settings():
+    """
+    Читает настройки скрипта из переменных окружения в переменные модуля.
+    Вызывается при импорте и еще раз из setup() после загрузки .env.
+    """
+    global DIRECTION_FOR_GET_TALONS, EMIAS_LINK, WARM_SESSION, QUEUE_LOGGING, ADAPTIVE_SCHEDULE, WEEKS_AHEAD, BROWSER, LEAN_BROWSER, PROFILE_TEMPLATE, SCAN_STALE_MINUTES, CAPTURE, CAPTURE_PATTERNS
+    DIRECTION_FOR_GET_TALONS = os.getenv("DIRECTION_FOR_GET_TALONS")
+    # Адрес входа в ЕМИАС, для замеров можно подставить локальную заглушку из stand/server.py.
+    EMIAS_LINK = os.getenv("EMIAS_LINK", "нет ссылок")
+    # Держать ли браузер с входом в ЕМИАС открытым между запусками по расписанию.
+    WARM_SESSION = os.getenv("MONIKI_WARM_SESSION", "0") == "1"
+    # Писать логи фоновым потоком через очередь, чтобы запись в файлы не тормозила клики.
+    QUEUE_LOGGING = os.getenv("MONIKI_QUEUE_LOG", "0") == "1"
+    # Подстраивать частоту опроса под историю открытий ячеек вместо ровных 4 минут(moniki_scheduler.py).
+    ADAPTIVE_SCHEDULE = os.getenv("MONIKI_ADAPTIVE", "0") == "1"
+    # На сколько недель вперед искать ячейки для записи.
+    WEEKS_AHEAD = int(os.getenv("MONIKI_WEEKS", "3"))
+    # Браузер для скрипта: firefox или chrome(base_sel_cls.BROWSERS).
+    BROWSER = os.getenv("MONIKI_BROWSER", "firefox")
+    # Облегченный профиль браузера: без картинок, шрифтов, анимаций и счетчиков, get не ждет полной загрузки.
+    LEAN_BROWSER = os.getenv("MONIKI_LEAN", "0") == "1"
+    # Запускать Firefox с клона шаблонного профиля(frfx_profiles.py): расширения уже стоят, кэш сайта прогрет.
+    PROFILE_TEMPLATE = os.getenv("MONIKI_PROFILE_TEMPLATE", "0") == "1"
+    # Через сколько минут заново проверять группу направлений, где прошлый поиск ничего не дал, если талонов столько же.
+    SCAN_STALE_MINUTES = float(os.getenv("MONIKI_SCAN_STALE_MINUTES", "60"))
+    # Брать талоны и расписание из JSON ответов ЕМИАС, которые получает страница, а не разбирать таблицы по xpath.
+    CAPTURE = os.getenv("MONIKI_CAPTURE", "0") == "1"
+    # Регулярки адресов запросов ЕМИАС со специальностями и с расписанием недели.
+    CAPTURE_PATTERNS = {
+        "specialties": os.getenv("MONIKI_CAPTURE_SPECIALTIES", "/api/specialties"),
+        "schedule": os.getenv("MONIKI_CAPTURE_SCHEDULE", "/api/schedule"),
+    }
+
+
+load_settings()
+
+_is_setup = False
+
+
+def setup(worker: str = None):
+    """
+    Подготовка к запуску скрипта: загружает .env, перечитывает настройки, настраивает лог и применяет миграции БД
+    (сводки открытий, очередь, аренды нужны уже первому put_change_data, а на актуальной схеме это одно чтение).
+    Вынесена из импорта, чтобы импорт модуля(БД, воркеры, замеры) не тянул dotenv и не трогал файл лога.
+    Воркер(worker - его имя) пишет в свой moniki_class.<worker>.log дописыванием, чтобы не затирать лог основного
+    процесса и не перемешивать строки с другими воркерами. Повторный вызов ничего не делает.
+    """
+    global _is_setup
+    if _is_setup:
+        return
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    load_settings()
+    logging.basicConfig(
+        level=logging.INFO,
+        filename=f"moniki_class.{worker}.log" if worker else "moniki_class.log",
+        filemode="a" if worker else "w",
+        format="%(asctime)s %(levelname)s %(message)s")
+    logging.info(f"Схема БД: версия {bd.migrate()}.")
+    _is_setup = True
+
+
+# Забирает текст строк таблицы специальностей шага 2 за один запрос к браузеру.
+# arguments[0] - xpath строк с текстом (специальность и 'Свободно: N' идут парой), arguments[1] - xpath строк таблицы.
+JS_GET_TALONS = """
+var lines = document.evaluate(arguments[0], document, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+var rows = document.evaluate(arguments[1], document, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+var result = [];
+for (var i = 0; i < lines.snapshotLength; i++) {
+    result.push(lines.snapshotItem(i).textContent.trim());
+}
+return {rows: rows.snapshotLength, lines: result};
+"""
+
+# Кликает по первому элементу по xpath(arguments[0]) из JS, возвращает false, если элемента нет.
+JS_CLICK_XPATH = """
+var node = document.evaluate(arguments[0], document, null, XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue;
+if (!node) {
+    return false;
+}
+node.click();
+return true;
+"""
+
+# Считает элементы по xpath(arguments[0]) без передачи самих элементов в python.
+JS_COUNT_XPATH = """
+return document.evaluate(arguments[0], document, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null).snapshotLength;
+"""
 
-logging.basicConfig(
-    level=logging.INFO,
-    filename="moniki_class.log",
-    filemode="w",
-    format="%(asctime)s %(levelname)s %(message)s")
+# Забирает все ячейки недельной сетки за один запрос: arguments[0] - xpath ячеек,
+# arguments[1], arguments[2], arguments[3] - xpath врача, даты и числа свободных мест относительно ячейки.
+JS_SCHEDULE_GRID = """
+function part(node, xpath) {
+    var found = document.evaluate(xpath, node, null, XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue;
+    return found ? found.textContent.trim() : null;
+}
+var cells = document.evaluate(arguments[0], document, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+var result = [];
+for (var i = 0; i < cells.snapshotLength; i++) {
+    var cell = cells.snapshotItem(i);
+    result.push({
+        doctor: part(cell, arguments[1]),
+        date: part(cell, arguments[2]),
+        free: part(cell, arguments[3]),
+        text: cell.textContent.trim()
+    });
+}
+return result;
+"""
 
 def notif(title="Заголовок", message="Сообщение."):
     """Уведомляет о каких-либо событиях."""
+    from plyer import notification
+
     notification.notify(
         title=title,
         message=message)
@@ -45,13 +149,174 @@ def notif(title="Заголовок", message="Сообщение."):
 def now():
     return datetime.datetime.now().strftime("%d.%m.%Y %H:%M:%S")
 
+def parse_talons(raw) -> Union[None, list]:
+    """
+    Проверяет форму ответа JS_GET_TALONS и превращает его в список [(специальность, талоны), ...].
+    Строк текста должно быть ровно в два раза больше, чем строк таблицы: специальность и 'Свободно: N'.
+    Если форма не сошлась, возвращает None.
+    """
+    if not isinstance(raw, dict):
+        return None
+    rows, lines = raw.get("rows"), raw.get("lines")
+    if not isinstance(rows, int) or not isinstance(lines, list):
+        return None
+    if rows == 0 or len(lines) != rows * 2:
+        return None
+    talons = []
+    for spec, count_spec in zip(lines[::2], lines[1::2]):
+        if not spec or ': ' not in count_spec:
+            return None
+        count_spec = count_spec.split(': ')[1].strip()
+        if not count_spec.isdigit():
+            return None
+        talons.append((spec, int(count_spec)))
+    return talons
+
+def parse_schedule_grid(raw) -> Union[None, list]:
+    """
+    Проверяет форму ответа JS_SCHEDULE_GRID и возвращает список ячеек недели:
+        [{'index': номер по порядку, 'doctor': врач, 'date': дата, 'free': свободно или None, 'text': весь текст}, ...]
+    Если у какой-то ячейки нет даты или ответ не список словарей, то возвращает None.
+    """
+    if not isinstance(raw, list):
+        return None
+    cells = []
+    for index, cell in enumerate(raw):
+        if not isinstance(cell, dict) or not cell.get("date") or not isinstance(cell.get("text"), str):
+            return None
+        free = cell.get("free")
+        digits = ''.join(char for char in free if char.isdigit()) if isinstance(free, str) else ''
+        cells.append({
+            "index": index,
+            "doctor": cell.get("doctor") or '',
+            "date": cell["date"],
+            "free": int(digits) if digits else None,
+            "text": cell["text"],
+        })
+    return cells
+
+def _payload_list(payload) -> Union[None, list]:
+    """Список из JSON ответа: сам ответ, если это список, или первый список среди значений словаря."""
+    if isinstance(payload, list):
+        return payload
+    if isinstance(payload, dict):
+        for value in payload.values():
+            if isinstance(value, list):
+                return value
+    return None
+
+def parse_specialties_payload(payload) -> Union[None, list]:
+    """
+    Превращает перехваченный JSON ответ со специальностями в список [(специальность, талоны), ...] как parse_talons.
+    Название берется из полей name/specialty/title, число талонов из free/count/freeCount/count_talons.
+    Если форма не сошлась, возвращает None.
+    """
+    items = _payload_list(payload)
+    if not items:
+        return None
+    talons = []
+    for item in items:
+        if not isinstance(item, dict):
+            return None
+        spec = next((item[key] for key in ("name", "specialty", "title") if isinstance(item.get(key), str)), None)
+        count_spec = next((item[key] for key in ("free", "count", "freeCount", "count_talons") if key in item), None)
+        if isinstance(count_spec, str) and count_spec.isdigit():
+            count_spec = int(count_spec)
+        if not spec or not isinstance(count_spec, int) or isinstance(count_spec, bool):
+            return None
+        talons.append((spec.strip(), count_spec))
+    return talons
+
+def parse_schedule_payload(payload) -> Union[None, list]:
+    """
+    Превращает перехваченный JSON ответ с расписанием недели в список ячеек той же формы, что parse_schedule_grid.
+    У ячейки должны быть врач и дата, свободные места - список времен times или число free.
+    Если форма не сошлась, возвращает None.
+    """
+    items = _payload_list(payload)
+    if items is None:
+        return None
+    cells = []
+    for index, item in enumerate(items):
+        if not isinstance(item, dict) or not item.get("date"):
+            return None
+        times = item.get("times")
+        free = len(times) if isinstance(times, list) else item.get("free")
+        if free is not None and (not isinstance(free, int) or isinstance(free, bool)):
+            return None
+        doctor = item.get("doctor") or ''
+        cells.append({
+            "index": index,
+            "doctor": doctor,
+            "date": item["date"],
+            "free": free,
+            "text": f'{doctor} {item["date"]} {" ".join(times) if isinstance(times, list) else ""}'.strip(),
+        })
+    return cells
+
+
+def normalize_specific(specific: str) -> Union[None, str]:
+    """
+    Приводит специфику к одному виду, чтобы направления с одинаковым поиском попадали в одну группу:
+    пустая - None, лишние пробелы убираются, фамилии после 'ФИО: ' идут через ', '.
+    """
+    if specific is None or not specific.strip():
+        return None
+    specific = ' '.join(specific.split())
+    if 'ФИО: ' in specific:
+        names = [name.strip() for name in specific.split("ФИО: ")[1].split(',') if name.strip()]
+        return "ФИО: " + ', '.join(names)
+    return specific
+
+@functools.lru_cache(maxsize=256)
+def build_locator(specific: str) -> str:
+    """Локатор ячеек для специфики, см. Sel.get_locator_for_search. Кэшируется, поэтому строится раз на специфику."""
+    logging.info("Проверяю, что специфика есть.")
+    if specific is None:
+        logging.info("Специфика пуста, возвращаю локатор для поиска свободных ячеек.")
+        return нет ссылкам
+    logging.info("Проверяю, что в специфике есть ФИО.")
+    if 'ФИО: ' in specific:
+        logging.info("Обнаружил 'ФИО' в специфике. Оставляю только часть строки с фио.")
+        specific = specific.split("ФИО: ")[1]
+        logging.info("Проверяю, есть ли другие фамилии в специфике. Если есть, то делаю списком, если нет, то оставляю строкой.")
+        specific = specific if ',' not in specific else specific.split(',')
+        logging.info("Если специфика в итоге строка, то ФИО одно. Возвращаю локатор для одного фио.")
+        if isinstance(specific, str):
+            return fнет ссылкам
+        logging.info("Если специфика в итоге список, то ФИО много. Возвращаю локатор для поиска многих фио.")
+        many_names_on_str = ''.join([f'contains(text(), "{x}") or ' for x in specific])
+        locator = (
+            нет ссылкам
+            f'{many_names_on_str[:-4]}'
+            нет ссылкам
+            )
+        return locator
+    logging.info("В специфике специальность, возвращаю локатор для поиска специальности в разном регистре.")
+    locator = (
+        fнет ссылкам
+        f' or contains(text(), "{specific.upper()}")'
+        fнет ссылкам
+    )
+    return locator
+
+
+def date_sort_key(date_text: str) -> datetime.datetime:
+    """Ключ сортировки ячеек по дате вида дд.мм.гггг внутри текста, ячейки без даты уходят в конец."""
+    for word in date_text.split():
+        try:
+            return datetime.datetime.strptime(word.strip(','), "%d.%m.%Y")
+        except ValueError:
+            continue
+    return datetime.datetime.max
+
+
 def check_html(sel):
-    html = sel.browser.page_source
-    file = open("foo.html", "w", encoding='UTF-8')
-    file.write(html)
-    file.close()
+    """Снимок текущей страницы(скриншот и DOM) в кольцевую папку sel_artifacts."""
+    sel.save_artifacts("check_html")
 
 
+@timing.time_methods
 class Sel:
     """Создан для помощи врачам в целях оптимизации процесса записи в МОНИКИ."""
 
@@ -62,9 +327,32 @@ class Sel:
         # Добавляем путь к директории проекта в sys.path
         project_directory = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
         sys.path.append(project_directory)
-        from frfx_hlss_sel_cls import SeleniumBrow as SB
+        from base_sel_cls import enable_queue_logging
+
+        setup()
+        if QUEUE_LOGGING:
+            enable_queue_logging()
+
+        # Где сейчас сессия и работа, переживает перезапуск браузера(moniki_flow).
+        self.checkpoint = flow.Checkpoint()
+        self.start_browser()
 
-        self.sel = SB(link="нет ссылок", main=main, headless=True)
+    def start_browser(self):
+        """Запускает браузер для ЕМИАС."""
+        from base_sel_cls import make_browser
+
+        options = {"template": True} if PROFILE_TEMPLATE and BROWSER == "firefox" else {}
+        self.sel = make_browser(BROWSER, link=EMIAS_LINK, headless=True, lean=LEAN_BROWSER, **options)
+
+    def restart_browser(self):
+        """Закрывает браузер, если он еще отвечает, и запускает новый. Сессия начинается заново."""
+        logging.info("Перезапускаю браузер.")
+        try:
+            self.sel.quit()
+        except Exception as err:
+            logging.info(f"Браузер не закрылся, он уже не отвечал.\n{err}")
+        self.start_browser()
+        self.checkpoint.set_session(flow.START)
     
     def open_emias(self):
         """Открывает сайт ЕМИАСА."""
@@ -116,16 +404,199 @@ class Sel:
         """Переключает на окно с направлениями."""
         try:
             logging.info("Ожидает пока окон не станет больше одного")
-            while len(self.sel.browser.window_handles) == 1:
-                time.sleep(2)
+            self.sel.wait_windows(2)
 
             logging.info("Открывается новое окно и переходим в него")
             new_window = self.sel.browser.window_handles[1]
             self.sel.browser.switch_to.window(new_window)
+            if LEAN_BROWSER:
+                self.sel.wait_page_ready()
+                self.sel.disable_animations()
         except Exception as err:
             logging.error(f"Ошибка при переключении на окно с направлениями в методе switch_to_another_window\n{err}", exc_info=True)
 
 
+    def save_session(self):
+        """Сохраняет куки, localStorage и адрес окна с направлениями после полного входа(moniki_session)."""
+        if not session.is_enabled():
+            return
+        try:
+            browser = self.sel.browser
+            session.save(session.collect(browser, browser.current_url))
+        except Exception as err:
+            logging.error(f"Ошибка при сохранении сессии ЕМИАС в методе save_session\n{err}", exc_info=True)
+
+    def restore_session(self) -> bool:
+        """
+        Восстанавливает сохраненную сессию и сразу открывает окно с направлениями.
+        Если сессии нет или ЕМИАС ее не принял, то убирает ее следы из браузера и возвращает False.
+        """
+        state = session.load()
+        if state is None:
+            return False
+        browser = self.sel.browser
+        try:
+            logging.info("Восстанавливаю сохраненную сессию ЕМИАС, вход пропускается.")
+            session.apply(browser, state)
+            if LEAN_BROWSER:
+                self.sel.wait_page_ready()
+                self.sel.disable_animations()
+            # Редирект на другой домен - это страница входа, а не окно с направлениями.
+            same_site = session.origin(browser.current_url) == session.origin(state["directions_url"])
+            if same_site and self.is_session_alive():
+                return True
+        except Exception as err:
+            logging.error(f"Ошибка при восстановлении сессии ЕМИАС в методе restore_session\n{err}", exc_info=True)
+        logging.info("ЕМИАС не принял сохраненную сессию, выполняю полный вход.")
+        session.forget()
+        for handle in browser.window_handles[1:]:
+            browser.switch_to.window(handle)
+            browser.close()
+        browser.switch_to.window(browser.window_handles[0])
+        try:
+            session.clear(browser, state)
+        except Exception as err:
+            logging.error(f"Ошибка при очистке сессии ЕМИАС в методе restore_session\n{err}", exc_info=True)
+        browser.delete_all_cookies()
+        return False
+
+    def enter(self):
+        """
+        Шаг входа: сохраненная сессия, если ее примут(тогда сразу и окно с направлениями), иначе сайт, логин и пароль.
+        """
+        if self.restore_session():
+            self.prepare_directions()
+            self.checkpoint.reach(flow.SESSION, flow.DIRECTIONS_OPEN)
+            return
+        self.open_emias()
+        self.input_login_and_pass()
+        self.log_in()
+        self.sel.raise_if_failed()
+
+    def open_directions(self):
+        """Шаг окна с направлениями: раздел направлений, окно с ними, сохранение сессии и очистка фильтров."""
+        self.open_section_directs()
+        self.switch_to_another_window()
+        self.sel.raise_if_failed()
+        self.save_session()
+        self.prepare_directions()
+
+    def prepare_directions(self):
+        """Готовит открытое окно с направлениями к поиску: перехват ответов и очистка фильтров."""
+        if CAPTURE:
+            logging.info("Включаю перехват JSON ответов ЕМИАС в окне с направлениями.")
+            self.sel.enable_capture(CAPTURE_PATTERNS)
+        # окно с направление, очистка фильтра и поиск направлений
+        self.open_filters()
+        self.del_doctor_filter()
+        self.sel.raise_if_failed()
+
+    def mark_step(self, name: str):
+        """
+        Начало шага сценария: отмечает тик и шаг, с ними подписываются снимки страницы при ошибках, и забывает
+        ошибку клика, оставшуюся от прошлого шага.
+        """
+        self.sel.artifact_tags.update(tick=timing.current_tick(), step=name)
+        self.sel.clear_failed()
+
+    def session_steps(self) -> list:
+        """Шаги сессии для moniki_flow.Flow: вход и окно с направлениями."""
+        return [
+            ("enter", flow.SESSION, flow.LOGGED_IN, self.enter),
+            ("open_directions", flow.SESSION, flow.DIRECTIONS_OPEN, self.open_directions),
+        ]
+
+    def log_in_and_open_directions(self):
+        """Вход и окно с направлениями с восстановлением после ошибок. Если сессия уже открыта, то ничего не делает."""
+        flow.Flow(self.checkpoint, self.session_steps(), self.recover, on_step=self.mark_step).run()
+
+    def is_session_alive(self) -> bool:
+        """
+        Проверяет, что браузер жив, окно с направлениями открыто и активно, а ЕМИАС не выкинул на форму входа.
+        Ничего не ждет: неявное ожидание на время проверки снимается.
+        """
+        try:
+            browser = self.sel.browser
+            handles = browser.window_handles
+            if len(handles) < 2 or browser.current_window_handle != handles[1]:
+                logging.info("Окна с направлениями нет или оно не активно, сессия считается потерянной.")
+                return False
+            browser.implicitly_wait(0)
+            is_login_form = len(browser.find_elements("id", "Login")) > 0
+            browser.implicitly_wait(1)
+            if is_login_form:
+                logging.info("ЕМИАС показывает форму входа, сессия истекла.")
+                return False
+            return True
+        except Exception as err:
+            logging.info(f"Браузер не отвечает, сессия потеряна.\n{err}")
+            return False
+
+    def is_browser_alive(self) -> bool:
+        """Отвечает ли браузер."""
+        try:
+            return len(self.sel.browser.window_handles) > 0
+        except Exception:
+            return False
+
+    def session_stage(self) -> str:
+        """
+        Какая контрольная точка сессии жива в браузере: DIRECTIONS_OPEN, если окно с направлениями открыто и ЕМИАС
+        не выкинул на форму входа, LOGGED_IN, если есть только первое окно и в нем не форма входа, иначе START.
+        """
+        browser = self.sel.browser
+        handles = browser.window_handles
+        if len(handles) >= 2:
+            browser.switch_to.window(handles[1])
+            if self.is_session_alive():
+                return flow.DIRECTIONS_OPEN
+            return flow.START
+        browser.switch_to.window(handles[0])
+        browser.implicitly_wait(0)
+        is_login_form = len(browser.find_elements("id", "Login")) > 0
+        browser.implicitly_wait(1)
+        if browser.current_url.startswith("http") and not is_login_form:
+            return flow.LOGGED_IN
+        return flow.START
+
+    def close_extra_windows(self):
+        """Закрывает все окна, кроме первого, и переключается в него."""
+        browser = self.sel.browser
+        for handle in browser.window_handles[1:]:
+            browser.switch_to.window(handle)
+            browser.close()
+        browser.switch_to.window(browser.window_handles[0])
+
+    def reset_directions_window(self):
+        """Перезагружает окно с направлениями: закрывает открытые направление и окна записи одной загрузкой страницы."""
+        logging.info("Перезагружаю окно с направлениями.")
+        self.sel.browser.refresh()
+        if LEAN_BROWSER:
+            self.sel.wait_page_ready()
+            self.sel.disable_animations()
+        self.prepare_directions()
+
+    def recover(self):
+        """
+        Восстановление после ошибки для moniki_flow.Flow: выясняет, какая контрольная точка сессии жива, и возвращает
+        браузер к ней. Упавший браузер перезапускается, истекшая сессия забывается и вход повторяется.
+        """
+        self.sel.clear_failed()
+        if not self.is_browser_alive():
+            self.restart_browser()
+            return
+        stage = self.session_stage()
+        logging.info(f"Живая контрольная точка сессии: {stage}.")
+        if stage == flow.DIRECTIONS_OPEN:
+            self.reset_directions_window()
+        elif stage == flow.LOGGED_IN:
+            self.sel.browser.refresh()
+        else:
+            # Сессия этого браузера истекла, сохраненная - та же самая.
+            session.forget()
+            self.close_extra_windows()
+        self.checkpoint.set_session(stage)
+
     def open_filters(self):
         """Раскрывает панель фильтров при поиске направления."""
         try:
@@ -148,11 +619,12 @@ class Sel:
         except Exception as err:
             logging.error(f"Ошибка при удалении врача из фильтров в методе del_doctor_filter\n{err}", exc_info=True)
             
-    def clear_direct_and_search(self, direction_number=DIRECTION_FOR_GET_TALONS):
+    def clear_direct_and_search(self, direction_number: str = None):
         """
         Очищает поле для поиска направлений и вводит туда номер.
-        По умолчанию используется моё направление для поиска доступных ячеек.
+        По умолчанию используется моё направление для поиска доступных ячеек(DIRECTION_FOR_GET_TALONS на момент вызова).
         """
+        direction_number = direction_number or DIRECTION_FOR_GET_TALONS
         try:
             logging.info("Находит поле для поиска направлений.")
             input_direction_number = self.sel.find_xpath(нет ссылкам)
@@ -171,23 +643,25 @@ class Sel:
             logging.info("Находит кнопку 'Найти'")
             click_find = self.sel.find_xpath(нет ссылкам)
             logging.info("Ждем пока крутилка не исчезнет.")
-            self.sel.elem_invis(нет ссылкам)
+            self.sel.wait_spinner_gone(нет ссылкам)
             logging.info("Кликает по кнопке 'Найти'")
             self.sel.click(click_find)
-            time.sleep(2)
+            logging.info("Жду, пока таблица направлений не перестанет обновляться.")
+            self.sel.wait_dom_quiet()
         except Exception as err:
             logging.error(f"Ошибка при нажатии кнопки 'Найти' в методе find_direct\n{err}", exc_info=True)
 
-    def get_in_directon(self, direction_number=DIRECTION_FOR_GET_TALONS):
+    def get_in_directon(self, direction_number: str = None):
         """Ждет загрузки направления и переходит в него."""
+        direction_number = direction_number or DIRECTION_FOR_GET_TALONS
         try:
             logging.info("Задаю неявные ожидания в секунду.")
             self.sel.browser.implicitly_wait(1)
             logging.info("Жду, пока исчезнет элемент загрузки.")
-            self.sel.elem_invis(нет ссылкам)
+            self.sel.wait_spinner_gone(нет ссылкам)
             logging.info("Жду, пока появится строка с номером направления.")
             self.sel.elem_vis(fнет ссылкам)
-            time.sleep(1)
+            self.sel.wait_dom_quiet()
             logging.info("Ищу кнопку просмотра направления (глаз или карандаш).")
             button_eye_or_pencil = self.sel.find_xpath(
                 нет ссылкам
@@ -198,8 +672,9 @@ class Sel:
         except Exception as err:
             logging.error(f"Ошибка при нажатии кнопки 'Просмотреть направление' в методе get_in_directon, направление {direction_number}\n{err}", exc_info=True)
 
-    def check_write_button(self, direction_number=DIRECTION_FOR_GET_TALONS):
+    def check_write_button(self, direction_number: str = None):
         """"Проверяет, что кнопка записи направления находится на странице и кликает по ней."""
+        direction_number = direction_number or DIRECTION_FOR_GET_TALONS
         try:
             logging.info("Жду, что по кнопке можно кликнуть.")
             self.sel.elem_clickable(нет ссылкам)
@@ -224,48 +699,99 @@ class Sel:
         except Exception as err:
             logging.error(f"Ошибка при клике по шагу 2 в методе click_step_2\n{err}", exc_info=True)
 
+    def harvest_talons_bulk(self) -> Union[None, list]:
+        """
+        Забирает пары (специальность, количество свободных талонов) из таблицы шага 2 одним вызовом execute_script.
+        Возвращает список кортежей [(специальность, талоны), ...] или None, если ответ скрипта не прошел проверку формы.
+        """
+        try:
+            logging.info("Забираю строки специальностей и талонов одним JS запросом.")
+            raw = self.sel.browser.execute_script(JS_GET_TALONS, нет ссылкам, нет ссылкам)
+            talons = parse_talons(raw)
+            if talons is None:
+                logging.info(f"Ответ JS не прошел проверку формы, перехожу на поиск по xpath. {raw=}")
+            return talons
+        except Exception as err:
+            logging.error(f"Ошибка при получении талонов одним запросом в методе harvest_talons_bulk\n{err}", exc_info=True)
+
+    def harvest_talons_captured(self) -> Union[None, list]:
+        """
+        Берет пары (специальность, талоны) из последнего перехваченного ответа ЕМИАС со специальностями.
+        Возвращает None, если режим перехвата выключен, ответа не было или его форма не сошлась.
+        """
+        if not CAPTURE:
+            return None
+        try:
+            items = self.sel.take_captured("specialties")
+            if not items:
+                logging.info("Ответ ЕМИАС со специальностями не перехвачен, беру талоны со страницы.")
+                timing.record("capture.miss", 0, ok=False, name="specialties")
+                return None
+            talons = parse_specialties_payload(items[-1].get("data"))
+            if talons is None:
+                logging.info(f"Перехваченный ответ со специальностями не прошел проверку формы. {items[-1].get('url')=}")
+            return talons
+        except Exception as err:
+            logging.error(f"Ошибка при разборе перехваченных талонов в методе harvest_talons_captured\n{err}", exc_info=True)
+
+    def harvest_talons_by_xpath(self) -> list:
+        """
+        Находит специальности и количество талонов построчно через xpath, два запроса на строку.
+        Запасной вариант для harvest_talons_bulk.
+        """
+        talons = []
+        logging.info("Прохожу в цикле специальности и количество свободных талонов с шагом 2(вторая строка это число направлений).")
+        for speacialty in range(0, len(self.sel.find_xpath_elements(нет ссылкам))*2, 2):
+            logging.info("Нахожу специальность от первой строки и вниз.")
+            spec = self.sel.find_xpath(fнет ссылкам)
+            logging.info("Нахожу количество свободныхталонов для текущей строки специальности.")
+            count_spec = self.sel.find_xpath(fнет ссылкам)
+            logging.info("Проверка что специальность и количество ячеек не None.")
+            # Проверка, что специальность и число ячеек не ноль, так бывает)
+            if spec is not None and count_spec is not None:
+                spec = spec.text
+                count_spec = count_spec.text
+            else:
+                logging.info(f"Специальности с None: {speacialty+1} по номеру. Жду и пробую еще раз")
+                logging.info("На первом проходе специальность и количество талонов было None, пробую еще раз.")
+                spec = self.sel.find_xpath(fнет ссылкам).text
+                count_spec = self.sel.find_xpath(fнет ссылкам).text
+            logging.info("Определяю число талонов как второй элемент строки с текстом ': '.")
+            talons.append((spec, int(count_spec.split(': ')[1])))
+        return talons
+
     def get_talons(self):
         """
         Находит специальности и количество таланов для них, сохраняет в бд, заменяет данные о свободных талонах в таблице
         moniki_specialties."""
         try:
-            logging.info("Прохожу в цикле специальности и количество свободных талонов с шагом 2(вторая строка это число направлений).")
-            for speacialty in range(0, len(self.sel.find_xpath_elements(нет ссылкам))*2, 2):
-                logging.info("Нахожу специальность от первой строки и вниз.")
-                spec = self.sel.find_xpath(fнет ссылкам)
-                logging.info("Нахожу количество свободныхталонов для текущей строки специальности.")
-                count_spec = self.sel.find_xpath(fнет ссылкам)
-                logging.info("Проверка что специальность и количество ячеек не None.")
-                # Проверка, что специальность и число ячеек не ноль, так бывает)
-                if spec is not None and count_spec is not None:
-                    spec = spec.text
-                    count_spec = count_spec.text
-                else:
-                    logging.info(f"Специальности с None: {speacialty+1} по номеру. Жду и пробую еще раз")
-                    logging.info("На первом проходе специальность и количество талонов было None, пробую еще раз.")
-                    spec = self.sel.find_xpath(fнет ссылкам).text
-                    count_spec = self.sel.find_xpath(fнет ссылкам).text
-                logging.info("Определяю число талонов как второй элемент строки с текстом ': '.")
-                count_spec = count_spec.split(': ')[1]
+            talons = self.harvest_talons_captured()
+            if talons is None:
+                talons = self.harvest_talons_bulk()
+            if talons is None:
+                talons = self.harvest_talons_by_xpath()
+            logging.info("Открываю сессию БД, все изменения по талонам сохраняются одной транзакцией.")
+            with bd.session():
                 logging.info("Подгружаю в переменную текущее количество талонов по специальностям.")
                 specialty = bd.get_data_all_specialty()
-                logging.info("Проверяю, что специальность есть в БД, а если нет, то устанавливаю 0 талонов.")
-                if specialty.get(spec, 'Not') != 'Not':
-                    logging.info("Вычисляю разницу между талонами в БД и текущим количество(отриц.значение хорошо).")
-                    # Такая строка необходима, для некоторых специальностей count_spec сразу число, а не строка.
-                    change = specialty[spec] - int(count_spec) if isinstance(count_spec, str) else count_spec
-                    logging.info("Проверяю разницу между ячейками, если она не ноль, иду дальше.")
-                    if change != 0:
-                        logging.info(f"Специальность {spec} стало талонов {count_spec} изменилась на {change}")
-                        logging.info("Если разница талонов меньше -1, то добавляю в БД для аналитики. Не трогаю одиночные талоны - отмена других больниц.")
-                        if change < -1:
-                            logging.info("Добавляет информацию об открытии талонов для специальности в таблицу moniki_data.")
-                            bd.put_change_data(spec, int(change))
-                        logging.info("Меняет количество талонов в БД доступных для записи.")
-                        bd.change_value_specialty(spec, int(count_spec))
-                else:
-                    logging.info(f"Специальности {spec} не было в словаре ранее. Добавляю специальность и текущее кол-во талонов.")
-                    bd.put_specialty(spec, int(count_spec))
+                for spec, count_spec in talons:
+                    logging.info("Проверяю, что специальность есть в БД, а если нет, то устанавливаю 0 талонов.")
+                    if specialty.get(spec, 'Not') != 'Not':
+                        logging.info("Вычисляю разницу между талонами в БД и текущим количество(отриц.значение хорошо).")
+                        change = specialty[spec] - count_spec
+                        logging.info("Проверяю разницу между ячейками, если она не ноль, иду дальше.")
+                        if change != 0:
+                            logging.info(f"Специальность {spec} стало талонов {count_spec} изменилась на {change}")
+                            logging.info("Если разница талонов меньше -1, то добавляю в БД для аналитики. Не трогаю одиночные талоны - отмена других больниц.")
+                            if change < -1:
+                                logging.info("Добавляет информацию об открытии талонов для специальности в таблицу moniki_data.")
+                                bd.put_change_data(spec, int(change))
+                            logging.info("Меняет количество талонов в БД доступных для записи.")
+                            bd.change_value_specialty(spec, count_spec)
+                    else:
+                        logging.info(f"Специальности {spec} не было в словаре ранее. Добавляю специальность и текущее кол-во талонов.")
+                        bd.put_specialty(spec, count_spec)
+                    specialty[spec] = count_spec
 
             logging.info("Нахожу элемент кнопки 'Закрыть'")
             close_button = self.sel.find_xpath(нет ссылкам)
@@ -286,10 +812,10 @@ class Sel:
             logging.error(f"Ошибка при получении талонов в методе get_specialty_from_bd\n{err}", exc_info=True)
                                 
     def get_need_record(self) -> list:
-        """Запрос к БД и получение данных направлений не записанных."""
+        """Запрос к БД и получение очереди не записанных направлений по приоритету с учетом квот на специальность."""
         try:
-            logging.info("Обращаюсь к таблице moniki_records и получаю список направлений с данными без записи.")
-            need_record = bd.get_not_recorder()
+            logging.info("Обращаюсь к таблице moniki_records и получаю очередь направлений без записи, где квота не выбрана.")
+            need_record = bd.get_backlog()
             logging.info("Возвращаю список списков с данными по направлениям не записанных.")
             return need_record
         except Exception as err:
@@ -302,7 +828,7 @@ class Sel:
             self.sel.time_wait = 30
             self.sel.elem_vis(нет ссылкам)
             logging.info("Проверяю что нет спинера при клике по следующей неделе")
-            self.sel.elem_invis(нет ссылкам)
+            self.sel.wait_spinner_gone(нет ссылкам)
             logging.info("Проверяю, что кнопка 'Следующая неделя' кликабельна.")
             self.sel.elem_clickable(нет ссылкам)
             self.sel.time_wait = 60
@@ -312,6 +838,8 @@ class Sel:
 
     def check_visit_shedules(self) -> bool:
         """Проверяет, что сетка с расписанием есть и возвращает bool элемент."""
+        from selenium.common.exceptions import TimeoutException
+
         try:
             logging.info("Если есть сетка с расписанием на этой неделе, то возвращает True")
             self.sel.time_wait = 1
@@ -350,58 +878,124 @@ class Sel:
         Проверяет специфику, если она пуста, то возвращает локатор для поиска свободных ячеек.
         Если в специфике есть специальность, то возвращает локатор для поиска ячеек по специфике.
         Если в специфике есть 'ФИО', то возвращает локатор для поиска ячеек по фио.
+        Локатор строится один раз на специфику(build_locator).
         """
-        logging.info("Проверяю, что специфика есть.")
-        if specific is None:
-            logging.info("Специфика пуста, возвращаю локатор для поиска свободных ячеек.")
-            return нет ссылкам
-        logging.info("Проверяю, что в специфике есть ФИО.")
-        if 'ФИО: ' in specific:
-            logging.info("Обнаружил 'ФИО' в специфике. Оставляю только часть строки с фио.")
-            specific = specific.split("ФИО: ")[1]
-            logging.info("Проверяю, есть ли другие фамилии в специфике. Если есть, то делаю списком, если нет, то оставляю строкой.")
-            specific = specific if ',' not in specific else specific.split(',')
-            logging.info("Если специфика в итоге строка, то ФИО одно. Возвращаю локатор для одного фио.")
-            if isinstance(specific, str):
-                return fнет ссылкам
-            logging.info("Если специфика в итоге список, то ФИО много. Возвращаю локатор для поиска многих фио.")
-            many_names_on_str = ''.join([f'contains(text(), "{x}") or ' for x in specific])
-            locator = (
-                нет ссылкам
-                f'{many_names_on_str[:-4]}'
-                нет ссылкам
-                )
-            return locator
-        logging.info("В специфике специальность, возвращаю локатор для поиска специальности в разном регистре.")
-        locator = (
-            fнет ссылкам
-            f' or contains(text(), "{specific.upper()}")'
-            fнет ссылкам
-        )
-        return locator
+        return build_locator(specific)
 
     def click_next_week(self):
         """Находит элемент "Шаг 2", скроллит до него и затем кликает на кнопку "Следующая неделя"."""
         try:
             self.sel.time_wait = 60 
             logging.info("Проверяю что нет спинера при клике по следующей неделе")
-            self.sel.elem_invis(нет ссылкам)
+            self.sel.wait_spinner_gone(нет ссылкам)
             logging.info("Нахожу элемент с надписью 'шаг 2'.")
             step_2 = self.sel.find_xpath(нет ссылкам)
-            time.sleep(2)
+            self.sel.wait_element_stable(step_2)
             logging.info("Скроллю до элемнета 'Шаг 2'.")
             self.sel.scroll(step_2)
-            time.sleep(1)
+            self.sel.wait_element_stable(step_2)
 
             logging.info("Ищу кнопку 'Следующая неделя'.")
             next_week = self.sel.find_xpath(нет ссылкам)
             logging.info("Кликаю на кнопку 'Следующая неделя'.")
             self.sel.click(next_week)
             logging.info("Ждем пока крутилка не исчезнет после клика по следующей неделе.")
-            self.sel.elem_invis(нет ссылкам)
+            self.sel.wait_spinner_gone(нет ссылкам)
         except Exception as err:
             logging.error(f"Ошибка при клике на кнопку 'Следующая неделя' в методе click_next_week: {err}", exc_info=True)
 
+    def matches_specific(self, text: str, specific: str) -> bool:
+        """
+        Проверяет текст ячейки на специфику так же, как локатор из get_locator_for_search:
+        без специфики подходит любая ячейка, 'ФИО: ' - любая из фамилий с учетом регистра, иначе подстрока без учета регистра.
+        """
+        if specific is None:
+            return True
+        if 'ФИО: ' in specific:
+            names = [name.strip() for name in specific.split("ФИО: ")[1].split(',')]
+            return any(name in text for name in names if name)
+        return specific.lower() in text.lower()
+
+    def captured_week_cells(self, locator: str) -> Union[None, list]:
+        """
+        Берет ячейки текущей недели из последнего перехваченного ответа ЕМИАС с расписанием.
+        Номера ячеек годятся для кликов по locator, только если ячеек на странице столько же, сколько в ответе,
+        иначе возвращает None и неделя разбирается со страницы.
+        """
+        if not CAPTURE:
+            return None
+        try:
+            items = self.sel.take_captured("schedule")
+            if not items:
+                logging.info("Ответ ЕМИАС с расписанием недели не перехвачен, разбираю неделю со страницы.")
+                timing.record("capture.miss", 0, ok=False, name="schedule")
+                return None
+            cells = parse_schedule_payload(items[-1].get("data"))
+            if cells is None:
+                logging.info(f"Перехваченный ответ с расписанием не прошел проверку формы. {items[-1].get('url')=}")
+                return None
+            on_page = self.sel.browser.execute_script(JS_COUNT_XPATH, locator)
+            if on_page != len(cells):
+                logging.info(f"В ответе {len(cells)} ячеек, а на странице {on_page}, разбираю неделю со страницы.")
+                return None
+            return cells
+        except Exception as err:
+            logging.error(f"Ошибка при разборе перехваченного расписания в методе captured_week_cells: {err}", exc_info=True)
+
+    def extract_week_cells(self, locator: str) -> Union[None, list]:
+        """
+        Забирает все ячейки текущей недели с врачом, датой и числом свободных мест одним запросом к браузеру.
+        В режиме перехвата сначала берет их из JSON ответа ЕМИАС(captured_week_cells).
+        Возвращает список ячеек(parse_schedule_grid) или None, если ответ не прошел проверку формы.
+        """
+        cells = self.captured_week_cells(locator)
+        if cells is not None:
+            logging.info("Ячейки недели взяты из перехваченного ответа ЕМИАС.")
+            return cells
+        try:
+            logging.info("Забираю ячейки недели одним JS запросом.")
+            raw = self.sel.browser.execute_script(JS_SCHEDULE_GRID, locator, нет ссылкам, нет ссылкам, нет ссылкам)
+            cells = parse_schedule_grid(raw)
+            if cells is None:
+                logging.info("Ответ JS по ячейкам не прошел проверку формы, перехожу на клики по ячейкам.")
+            return cells
+        except Exception as err:
+            logging.error(f"Ошибка при получении ячеек недели в методе extract_week_cells: {err}", exc_info=True)
+
+    def choose_cells(self, cells: list, forbidden_dates: list, specific: str) -> list:
+        """
+        Отбирает ячейки, по которым есть смысл кликать: есть свободные места, дата не запрещена и подходит специфика.
+        Возвращает номера ячеек, самые ранние даты первыми.
+        """
+        chosen = [
+            cell for cell in cells
+            if cell["free"] != 0
+            and not self.check_data_record(data_record=cell["date"], forbidden_dates=forbidden_dates)
+            and self.matches_specific(f'{cell["doctor"]} {cell["text"]}', specific)
+        ]
+        chosen.sort(key=lambda cell: date_sort_key(cell["date"]))
+        logging.info(f"Из {len(cells)} ячеек недели подходят {len(chosen)}.")
+        return [cell["index"] for cell in chosen]
+
+    def wait_week_loaded(self):
+        """Минимальное ожидание недели: крутилка пропала и сетка перестала перерисовываться."""
+        self.sel.wait_spinner_gone(нет ссылкам)
+        self.sel.wait_dom_quiet(quiet_ms=200)
+
+    def next_week_fast(self):
+        """
+        Переходит на следующую неделю кликом из JS без скролла до 'Шаг 2' и ожиданий кликабельности.
+        Если кнопки не нашлось, то переходит обычным click_next_week.
+        """
+        try:
+            logging.info("Кликаю по кнопке 'Следующая неделя' из JS.")
+            if not self.sel.browser.execute_script(JS_CLICK_XPATH, нет ссылкам):
+                logging.info("Кнопка 'Следующая неделя' не найдена из JS, перехожу обычным способом.")
+                self.click_next_week()
+        except Exception as err:
+            logging.error(f"Ошибка при быстром переходе на следующую неделю в методе next_week_fast: {err}", exc_info=True)
+            self.click_next_week()
+
     def finding_free_cells(self, locator: str):
         """Находит все элементы на странице по переданному локатору и возвращает их."""
         try:
@@ -415,10 +1009,10 @@ class Sel:
         try:
             logging.info("Ищу элемент 'Шаг 2'.")
             step_2 = self.sel.find_xpath(нет ссылкам)
-            time.sleep(1)
+            self.sel.wait_element_stable(step_2)
             logging.info("Скроллю до элемента 'Шаг 2'.")
             self.sel.scroll(step_2)
-            time.sleep(1)
+            self.sel.wait_element_stable(step_2)
         except Exception as err:
             logging.error(f"Ошибка при скроллинге до элемента 'Шаг 2' в методе scroll_step_2: {err}", exc_info=True)
 
@@ -450,7 +1044,7 @@ class Sel:
                 # # ActionChains(sel.browser).move_to_element(free_cells).perform()
                 #ActionChains(sel.browser).move_by_offset(0, -60).perform()
             self.sel.time_wait = 60
-            time.sleep(1)
+            self.sel.wait_element_stable(free_cell)
             logging.info("Кликаю по ячейке.")
             self.sel.click_with_error(free_cell)
         except Exception as err:
@@ -485,7 +1079,7 @@ class Sel:
             active_cell = self.sel.find_xpath(нет ссылкам)
             logging.info("Кликаю по активной ячейке, чтобы вернуться ко всем ячейкам")
             self.sel.click_with_error(active_cell)
-            time.sleep(1)
+            self.sel.wait_dom_quiet()
         except Exception as err:
             logging.error(f"Ошибка при клике на активную ячейку в методе click_on_active_cell: {err}", exc_info=True)
 
@@ -514,7 +1108,7 @@ class Sel:
             cell_time = self.sel.find_xpath(нет ссылкам)
             logging.info("Скроллю до последней ячейки со временем.")
             self.sel.scroll(cell_time)
-            time.sleep(1)
+            self.sel.wait_element_stable(cell_time)
             logging.info("Сохраняю информацию о времени записи в переменную, чтобы ей вернуть.")
             time_record = cell_time.text
             logging.info("Кликаю по ячейке со временем.")
@@ -532,7 +1126,7 @@ class Sel:
             self.sel.scroll(click_write)
             logging.info("Пытаюсь кликнуть по кнопке записи.")
             self.sel.click(click_write)
-            time.sleep(1)
+            self.sel.wait_dom_quiet()
         except Exception as err:
             logging.error(f"Ошибка при нажатии на кнопку 'записать' в методе click_write_button_on_time: {err}", exc_info=True)
                                 
@@ -568,95 +1162,267 @@ class Sel:
 
 
 
+@timing.timed("main.harvest_talons")
+def harvest_talons(s: Sel):
+    """Открывает своё направление, доходит до шага 2 и обновляет в БД информацию о свободных талонах."""
+    s.clear_direct_and_search()
+    s.find_direct()
+    s.get_in_directon()
+    s.check_write_button()
+    s.scroll_step_2()
+    s.click_step_2()
+    s.get_talons()
+
+
+def group_by_specialty(need_record: list, specialty_info: dict) -> dict:
+    """
+    Раскладывает не записанные направления по специальностям, оставляя только те, где сейчас есть талоны.
+    Порядок направлений внутри специальности - порядок очереди из bd.get_backlog.
+        {специальность: [(номер направления, специфика), ...], ...}
+    """
+    groups = {}
+    for number_direct, spec, specific, *_ in need_record:
+        if specialty_info.get(spec, 0) > 0:
+            groups.setdefault(spec, []).append((number_direct, specific))
+    return groups
+
+
+def pending_records(spec: str) -> list:
+    """
+    Не записанные направления специальности spec в порядке очереди, заново из БД:
+        [(номер направления, специфика), ...]
+    Нужно при повторе записи после ошибки, чтобы не брать снова направления, записанные до неё.
+    """
+    return group_by_specialty(bd.get_backlog(), {spec: 1}).get(spec, [])
+
+
+def book_in_week(s: Sel, locator: str, numbers, forbidden_dates: list, number_direct: str, specific: str) -> bool:
+    """
+    Кликает по ячейкам недели с переданными номерами(по локатору), пока не запишет пациента.
+    Возвращает True, если записал.
+    """
+    logging.info("Цикл для прохода по доступным ячейкам для записи.")
+    for number_cell in numbers:
+        # Сетка недели дорисовывается после ответа на клик: не затихла за 2 с - кликаем как есть.
+        s.sel.wait_dom_quiet(quiet_ms=200)
+        s.search_free_cell_and_click(number_cell=number_cell, locator=locator)
+        s.sel.raise_if_failed()
+        data_record = s.get_date_cell()
+        if s.check_data_record(data_record=data_record, forbidden_dates=forbidden_dates):
+            s.click_on_active_cell()
+            continue
+        times = s.find_times_in_cell()
+        if len(times) == 0:
+            s.click_on_active_cell()
+            continue
+        time_record = s.select_last_time()
+        s.click_write_button_on_time()
+        s.click_close_after_write()
+        print('Запуск был в:', now(), f'Пациент записан. {specific=}.')
+        s.save_data_of_writing_in_bd(
+            date_record=data_record,
+            time_record=time_record,
+            direction_number=number_direct)
+        logging.info("Если пациента записан, то рвем цикл прохода по ячейкам времени")
+        return True
+    return False
+
+
+# Итог поиска по направлению: записал, подходящих ячеек нет ни на одной неделе, ячейки были, но записать не вышло.
+BOOKED, NO_SLOTS, MISSED = "booked", "no_slots", "missed"
+# Итог группы, если аренду специальности перехватил другой воркер: запись по специальности прекращается.
+LEASE_LOST = "lease_lost"
+
+
+@timing.timed("main.book_direction")
+def book_direction(s: Sel, number_direct: str, specific: str, first_week: int = 0) -> tuple:
+    """
+    Открывает направление, ищет подходящую ячейку по неделям и записывает пациента.
+    Недели до first_week(там уже не нашлось ячеек для группы) пролистываются без разбора. Если направление было
+    в работе при ошибке, то продолжает с той недели, на которой упали(s.checkpoint).
+    Возвращает (итог BOOKED/NO_SLOTS/MISSED, неделя, на которой были подходящие ячейки, или None).
+    """
+    first_week = max(first_week, s.checkpoint.resume_week(number_direct))
+    specific = s.correct_specific(specific)
+    logging.info(f"Номер направления: {number_direct} специфика: {specific}")
+    outcome, slot_week = NO_SLOTS, None
+    logging.info("Забываю ошибку клика, оставшуюся от прошлого направления.")
+    s.sel.clear_failed()
+    if CAPTURE:
+        logging.info("Сбрасываю ответы с расписанием, перехваченные до открытия направления.")
+        s.sel.take_captured("schedule")
+    s.clear_direct_and_search(direction_number=number_direct)
+    s.find_direct()
+    s.get_in_directon(direction_number=number_direct)
+    s.check_write_button(direction_number=number_direct)
+    s.scroll_step_2()
+    s.sel.raise_if_failed()
+    locator = s.get_locator_for_search(specific=specific)
+    all_cells_locator = s.get_locator_for_search(specific=None)
+    forbidden_dates = s.create_forbitten_dates()
+    logging.info(f"Цикл для проверки недель и ячеек на них. Смотрю вперед на {WEEKS_AHEAD} недель, начиная с {first_week}.")
+    for week in range(WEEKS_AHEAD):
+        with timing.span("main.week_scan", week=week):
+            s.wait_week_loaded()
+            if week < first_week:
+                logging.info(f"На неделе {week} для этой группы ячеек уже не было, листаю дальше.")
+                s.next_week_fast()
+                continue
+            s.checkpoint.at_week(number_direct, week)
+            logging.info("Задаю ожидание в секунду, чтобы не ждать слишком долго ячеек с расписанием.")
+            s.sel.time_wait = 1
+            cells = s.extract_week_cells(locator=all_cells_locator)
+            if cells is not None:
+                logging.info("Ячейки недели получены одним запросом, кликать буду только по подходящим.")
+                cells_locator = all_cells_locator
+                numbers = s.choose_cells(cells, forbidden_dates=forbidden_dates, specific=specific)
+            elif s.check_visit_shedules():
+                cells_locator = locator
+                numbers = range(len(s.finding_free_cells(locator=locator)))
+            else:
+                numbers = []
+            s.sel.time_wait = 60
+            if len(numbers) > 0:
+                outcome = MISSED
+                slot_week = week if slot_week is None else slot_week
+                s.scroll_step_2()
+                if book_in_week(s, cells_locator, numbers, forbidden_dates, number_direct, specific):
+                    outcome, slot_week = BOOKED, week
+                    logging.info("Если пациент записан, то рвем переходы по неделям.")
+                    break
+            s.sel.raise_if_failed()
+            if week < WEEKS_AHEAD - 1:
+                s.next_week_fast()
+    s.checkpoint.direction_done()
+    logging.info("Нажимаю на кнопку закрыть, если не получилось записать.")
+    s.click_close_after_search_all_weeks()
+    s.sel.wait_dom_quiet(quiet_ms=200)
+    return outcome, slot_week
+
+
+def group_by_specific(records: list) -> dict:
+    """
+    Раскладывает направления одной специальности по нормализованной специфике, порядок направлений сохраняется.
+        {специфика: [номер направления, ...], ...}
+    """
+    groups = {}
+    for number_direct, specific in records:
+        groups.setdefault(normalize_specific(specific), []).append(number_direct)
+    return groups
+
+
+def book_group(s: Sel, specific: str, numbers: list, limit: int = None, renew: Callable = None) -> tuple:
+    """
+    Записывает направления с одинаковой спецификой по порядку очереди, но не больше limit(None - без ограничения).
+    Первое направление заодно проверяет расписание для всей группы: если подходящих ячеек нет или записать не вышло,
+    то остальные направления группы в этот раз не открываются. После записи следующее направление ищет ячейки
+    с той недели, где они нашлись. После каждого направления вызывает renew()(продление аренды специальности),
+    если он вернул False, то группа прерывается с итогом LEASE_LOST.
+    Возвращает (итог последней попытки, сколько пациентов записано).
+    """
+    first_week = 0
+    outcome = NO_SLOTS
+    booked = 0
+    for position, number_direct in enumerate(numbers):
+        if limit is not None and booked >= limit:
+            logging.info(f"Квота специальности выбрана, оставшиеся {len(numbers) - position} направлений группы ждут.")
+            break
+        outcome, slot_week = book_direction(s, number_direct, specific, first_week=first_week)
+        if outcome == BOOKED:
+            booked += 1
+        if renew is not None and not renew():
+            logging.info("Аренду специальности перехватил другой воркер, прекращаю запись по ней.")
+            return LEASE_LOST, booked
+        if outcome != BOOKED:
+            logging.info(f"Итог {outcome} по направлению {number_direct}, оставшиеся {len(numbers) - position - 1} направлений группы пропускаю.")
+            break
+        first_week = slot_week
+    return outcome, booked
+
+
+def book_specialty(s: Sel, spec: str, records: list, worker: str = "main"):
+    """
+    Записывает направления одной специальности, предварительно взяв аренду специальности в БД.
+    Аренда продлевается после каждого направления, поэтому MONIKI_LEASE_SECONDS должно хватать на одно направление.
+    Направления делятся на группы по специфике, расписание проверяется один раз на группу(book_group).
+    Группа, где прошлый поиск ничего не дал, пропускается, пока у специальности столько же талонов
+    и не прошло SCAN_STALE_MINUTES(moniki_scan_state). Записывает не больше, чем позволяет квота специальности.
+    Если специальность уже в работе у другого воркера, то пропускает её.
+    """
+    ttl = workers.lease_seconds()
+    if not bd.acquire_lease(spec, worker, ttl):
+        logging.info(f"Специальность {spec} уже обрабатывает другой воркер, пропускаю.")
+        return
+    try:
+        talons = bd.get_count_talons(spec)
+        settled = bd.get_settled_groups(spec, talons, int(SCAN_STALE_MINUTES * 60))
+        limit = bd.get_quota_left(spec)
+        for specific, numbers in group_by_specific(records).items():
+            if limit is not None and limit <= 0:
+                logging.info(f"Квота записи по специальности {spec} выбрана, остальные группы ждут.")
+                break
+            if (specific or '') in settled:
+                logging.info(f"Группа {spec} / {specific}: талонов все так же {talons}, прошлый поиск ничего не дал, пропускаю.")
+                continue
+            logging.info(f"Группа {spec} / {specific}: направлений {len(numbers)}.")
+            outcome, booked = book_group(s, specific, numbers, limit, renew=lambda: bd.acquire_lease(spec, worker, ttl))
+            if outcome == LEASE_LOST:
+                return
+            if limit is not None:
+                limit -= booked
+            bd.put_scan_state(spec, specific or '', talons, outcome)
+    finally:
+        bd.release_lease(spec, worker)
+
+
+@timing.timed("main.book_need_record")
+def book_need_record(s: Sel):
+    """
+    Проходит по не записанным направлениям и записывает пациентов, если для специальности есть талоны.
+    При MONIKI_WORKERS больше 1 раздает специальности пулу процессов, каждый со своим браузером.
+    """
+    # запрос к БД и получение номеров направлений не записанных
+    specialty_info = s.get_specialty_from_bd()
+    need_record = s.get_need_record()
+    logging.info("Раскладываю направления по специальностям, где есть талоны.")
+    groups = group_by_specialty(need_record, specialty_info)
+    limit = workers.max_workers()
+    if limit > 1 and len(groups) > 1:
+        logging.info(f"Отдаю {len(groups)} специальностей пулу из не более {limit} воркеров.")
+        workers.run_pool(groups, limit)
+        return
+    for spec, records in groups.items():
+        book_specialty(s, spec, records)
+
+
+def tick(s: Sel):
+    """
+    Один проход по расписанию: вход, если сессии нет, талоны и запись. После ошибки продолжает с последней контрольной
+    точки(moniki_flow), а не с нуля. Если перезапуски кончились, то поднимает flow.RestartBudgetExceeded.
+    """
+    s.checkpoint.start_work()
+    steps = s.session_steps() + [
+        ("harvest_talons", flow.WORK, flow.TALONS_HARVESTED, lambda: harvest_talons(s)),
+        ("book_need_record", flow.WORK, flow.DONE, lambda: book_need_record(s)),
+    ]
+    try:
+        with timing.span("main.tick"):
+            flow.Flow(s.checkpoint, steps, s.recover, on_step=s.mark_step).run()
+    finally:
+        timing.flush()
+
+
 def main():
-    """Главная функция для создания класса и запуска методов."""
+    """Главная функция для создания класса и запуска методов. Ошибки разбирает tick, main не перезапускается."""
+    from selenium.common.exceptions import SessionNotCreatedException
+
+    timing.start_tick()
+    s = None
     try:
         s = Sel()
-        s.open_emias()
-        s.input_login_and_pass()
-        s.log_in()
-        s.open_section_directs()
-        s.switch_to_another_window()
-        # окно с направление, очистка фильтра и поиск направлений
-        s.open_filters()
-        s.del_doctor_filter()
-        s.clear_direct_and_search()
-        s.find_direct()
-        s.get_in_directon()
-        s.check_write_button()
-        s.scroll_step_2()
-        s.click_step_2()
-        s.get_talons()
-        # запрос к БД и получение номеров направлений не записанных
-        specialty_info = s.get_specialty_from_bd()
-        need_record = s.get_need_record()
-        logging.info("Если количество направлений, по которым нужно записать больше нуля, то начинаю их отработку.")
-        if len(need_record) > 0:
-            logging.info("Цикл по направлениям.")
-            for record in need_record:
-                logging.info("Задаю переменные из направлений: номер, специальность, специфика.")
-                number_direct = record[0]
-                spec = record[1]
-                specific = s.correct_specific(record[2])
-                if specialty_info[spec] > 0:
-                    logging.info(f"Номер направления: {number_direct} специальность: {spec} специфика: {specific}")
-                    logging.info("Если есть талоны для данной специальности, осуществляю запись.")
-                    s.clear_direct_and_search(direction_number=number_direct)
-                    s.find_direct()
-                    s.get_in_directon(direction_number=number_direct)
-                    s.check_write_button(direction_number=number_direct)
-                    s.scroll_step_2()
-                    locator = s.get_locator_for_search(specific=specific)
-                    forbidden_dates = s.create_forbitten_dates()
-                    logging.info("Цикл для проверки недель и ячеек на них. По умолчанию проверяем 3 недели.")
-                    for _ in range(3):
-                        s.check_next_week_button()
-                        if not s.check_visit_shedules():
-                            s.click_next_week()
-                            continue
-                        # далее в поиске ячеек смотрим на количество элементов
-                        logging.info("Задаю ожидание в секунду, чтобы не ждать слишком долго ячеек с расписанием.")
-                        s.sel.time_wait = 1
-                        free_cells = s.finding_free_cells(locator=locator)
-                        if len(free_cells) == 0:
-                            s.click_next_week()
-                            continue
-                        s.scroll_step_2()
-                        s.sel.time_wait = 60
-                        logging.info("Цикл для прохода по доступным ячейкам для записи.")
-                        is_not_writing = True
-                        for number_cell in range(len(free_cells)):
-                            time.sleep(1)
-                            s.search_free_cell_and_click(number_cell=number_cell, locator=locator) 
-                            data_record = s.get_date_cell()
-                            if s.check_data_record(data_record=data_record, forbidden_dates=forbidden_dates):
-                                s.click_on_active_cell()
-                                continue
-                            times = s.find_times_in_cell()
-                            if len(times) == 0:
-                                s.click_on_active_cell()
-                                continue
-                            time_record = s.select_last_time()
-                            s.click_write_button_on_time()
-                            s.click_close_after_write()
-                            is_not_writing = False
-                            print('Запуск был в:', now(), f'Пациент записан. {specific=}.')
-                            s.save_data_of_writing_in_bd(
-                                date_record=data_record,
-                                time_record=time_record,
-                                direction_number=number_direct)
-                            logging.info("Если пациента записан, то рвем цикл прохода по ячейкам времени")
-                            break
-                        if is_not_writing:
-                            s.click_next_week()
-                        else:
-                            logging.info("Если пациент записан, то рвем переходы по неделям.")
-                            break
-                    logging.info("Нажимаю на кнопку закрыть, если не получилось записать.")
-                    s.click_close_after_search_all_weeks()
-                        
-                    time.sleep(1)
-        s.sel.quit()
+        with timing.span("main.login"):
+            s.log_in_and_open_directions()
+        tick(s)
     except SessionNotCreatedException as e:
         print("\n---------------" f"\n{e}")
         print(
@@ -667,18 +1433,68 @@ def main():
             "\n---------------"
         )
         input("Для продолжения нажмитие Enter...")
+    except flow.RestartBudgetExceeded as e:
+        logging.error(f"__! Прогон прерван, следующий будет по расписанию\n{e}", exc_info=True)
     except Exception as e:
-        logging.error(f"__! Возникла ошибка в функции main\n{e}")
-        time.sleep(2)
-        if "because another element" in str(e):
-            s.sel.quit()
-            return main()
-        s.sel.quit()
-        return main()
+        logging.error(f"__! Возникла ошибка в функции main\n{e}", exc_info=True)
+    finally:
+        timing.flush()
+        if s is not None:
+            try:
+                s.sel.quit()
+            except Exception:
+                pass
+
+
+# Браузер теплой сессии, живет между запусками по расписанию.
+_warm_sel: Sel = None
+
+
+def warm_main():
+    """
+    Запуск с теплой сессией: браузер и окно с направлениями остаются открытыми между запусками по расписанию.
+    Вход в ЕМИАС повторяется только если браузера нет или сессия истекла.
+    """
+    global _warm_sel
+    from selenium.common.exceptions import SessionNotCreatedException
+
+    timing.start_tick()
+    try:
+        if _warm_sel is None:
+            logging.info("Теплой сессии нет, запускаю браузер и вхожу в ЕМИАС.")
+            _warm_sel = Sel()
+        elif not _warm_sel.is_session_alive():
+            logging.info("Теплая сессия потеряна, возвращаюсь к живой контрольной точке.")
+            _warm_sel.recover()
+        else:
+            logging.info("Теплая сессия жива, пропускаю вход.")
+        with timing.span("main.login"):
+            _warm_sel.log_in_and_open_directions()
+        tick(_warm_sel)
+    except SessionNotCreatedException as e:
+        print("\n---------------" f"\n{e}")
+        _warm_sel = None
+    except Exception as e:
+        logging.error(f"__! Возникла ошибка в функции warm_main, браузер будет перезапущен на следующем запуске\n{e}", exc_info=True)
+        if _warm_sel is not None:
+            try:
+                _warm_sel.sel.quit()
+            except Exception:
+                pass
+        _warm_sel = None
 
 
 if __name__ == "__main__":
-    main()
-    schedule.every(4).minutes.do(main)
+    import schedule
+
+    setup()
+    job = warm_main if WARM_SESSION else main
+    if ADAPTIVE_SCHEDULE:
+        from moniki_scheduler import AdaptiveScheduler
+
+        AdaptiveScheduler(job).run()
+    else:
+        job()
+        schedule.every(4).minutes.do(job)
     while True:
         schedule.run_pending()
@@ -3,15 +3,19 @@
 Содержит несколько таблиц:
 - moniki_specialties - специальности МОНИКИ, их наименование и количество свободных ячеек на текущий момент;
 - moniki_data - то есть таблица для анализа даты и времени открытия некоторого количества ячеек по определенным специальностям.
-- moniki_records - основная таблица для работы с направлениями и записью к врачам в МОНИКИ.
+- moniki_records - основная таблица для работы с направлениями и записью к врачам в МОНИКИ;
+- moniki_quotas - сколько пациентов по специальности скрипт может записать за день и за час;
+- moniki_records_duplicates - повторы номеров направлений, убранные из moniki_records миграцией 1.
 
 Записывает информацию об открытии ячеек, а также направлений пациентов. Основной скрипт для работы с БД.
 """
 
 import sqlite3
 from datetime import datetime as d
+import logging
 import os
 import sys
+import threading
 
 __version__ = "1.0.0"
 __author__ = "DinoWithPython"
@@ -109,42 +113,270 @@ def __create_table_records():
     con.close()
 
 
+# Сколько секунд соединение ждет, пока другой процесс(форма на Flask, воркеры) отпустит запись в БД.
+BUSY_TIMEOUT = 10
+
+# Пересчет сводок открытий ячеек из moniki_data. count_talons там отрицательный(уменьшение разницы), в сводке - число талонов.
+REBUILD_OPENINGS = """
+    DELETE FROM moniki_openings_hour;
+    DELETE FROM moniki_openings_weekday;
+    INSERT INTO moniki_openings_hour
+        SELECT name, CAST(strftime('%H', date_adding) AS INTEGER), COUNT(*), -SUM(count_talons)
+        FROM moniki_data GROUP BY 1, 2;
+    INSERT INTO moniki_openings_weekday
+        SELECT name, (CAST(strftime('%w', date_adding) AS INTEGER) + 6) % 7, COUNT(*), -SUM(count_talons)
+        FROM moniki_data GROUP BY 1, 2;
+    """
+
+# Миграции схемы по порядку. Номер последней примененной хранится в PRAGMA user_version,
+# каждая миграция выполняется одной транзакцией вместе со сменой номера.
+MIGRATIONS = [
+    # 1. Уникальный номер направления, частичный индекс на не записанные направления и индексы moniki_data.
+    #    Из повторов номеров направлений остается записанная строка(is_recorded = 1), а среди равных - последняя
+    #    добавленная, иначе уникальный индекс не создать. Остальные повторы переносятся в moniki_records_duplicates,
+    #    migrate() перед этим пишет их номера в лог(report_duplicate_directions).
+    """
+    CREATE TABLE IF NOT EXISTS moniki_records_duplicates AS SELECT * FROM moniki_records WHERE 0;
+    CREATE TEMP TABLE duplicate_rows AS
+        SELECT rowid AS row_id FROM (
+            SELECT rowid, ROW_NUMBER() OVER (PARTITION BY number_direct ORDER BY is_recorded DESC, rowid DESC) AS place
+            FROM moniki_records)
+        WHERE place > 1;
+    INSERT INTO moniki_records_duplicates SELECT * FROM moniki_records WHERE rowid IN (SELECT row_id FROM duplicate_rows);
+    DELETE FROM moniki_records WHERE rowid IN (SELECT row_id FROM duplicate_rows);
+    DROP TABLE duplicate_rows;
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_records_number_direct ON moniki_records(number_direct);
+    CREATE INDEX IF NOT EXISTS idx_records_not_recorded ON moniki_records(name, date_adding) WHERE is_recorded = 0;
+    CREATE INDEX IF NOT EXISTS idx_data_name_date ON moniki_data(name, date_adding);
+    CREATE INDEX IF NOT EXISTS idx_data_date ON moniki_data(date_adding);
+    """,
+    # 2. Сводки открытий ячеек по специальности и часу суток и по специальности и дню недели(0 - понедельник).
+    #    Их ведет put_change_data, поэтому аналитике не нужно читать всю moniki_data.
+    """
+    CREATE TABLE IF NOT EXISTS moniki_openings_hour(
+        name TEXT NOT NULL,
+        hour INTEGER NOT NULL,
+        openings INTEGER NOT NULL,
+        talons INTEGER NOT NULL,
+        PRIMARY KEY (name, hour)
+    );
+    CREATE TABLE IF NOT EXISTS moniki_openings_weekday(
+        name TEXT NOT NULL,
+        weekday INTEGER NOT NULL,
+        openings INTEGER NOT NULL,
+        talons INTEGER NOT NULL,
+        PRIMARY KEY (name, weekday)
+    );
+    """ + REBUILD_OPENINGS,
+    # 3. Итог последней проверки расписания по группе направлений(специальность и нормализованная специфика,
+    #    пустая специфика - ''): сколько талонов было у специальности, чем закончился поиск и когда.
+    """
+    CREATE TABLE IF NOT EXISTS moniki_scan_state(
+        name TEXT NOT NULL,
+        specific TEXT NOT NULL,
+        talons_seen INTEGER NOT NULL,
+        outcome TEXT NOT NULL,
+        checked_at TIMESTAMP NOT NULL,
+        PRIMARY KEY (name, specific)
+    );
+    """,
+    # 4. Приоритет направлений(больше - раньше), квоты записи по специальностям и индексы для очереди:
+    #    не записанные по приоритету и давности, записанные по специальности и времени записи для подсчета квот.
+    """
+    ALTER TABLE moniki_records ADD COLUMN priority INTEGER NOT NULL DEFAULT 0;
+    CREATE TABLE IF NOT EXISTS moniki_quotas(
+        name TEXT NOT NULL PRIMARY KEY,
+        per_day INTEGER,
+        per_hour INTEGER
+    );
+    CREATE INDEX IF NOT EXISTS idx_records_backlog ON moniki_records(priority DESC, date_adding) WHERE is_recorded = 0;
+    CREATE INDEX IF NOT EXISTS idx_records_name_changes ON moniki_records(name, date_changes);
+    """,
+    # 5. Аренда специальностей воркерами записи: name - специальность, worker - воркер, который сейчас по ней
+    #    записывает, expires - время, после которого аренда считается брошенной и её может забрать другой воркер.
+    #    Не даёт двум воркерам биться за одни и те же талоны.
+    """
+    CREATE TABLE IF NOT EXISTS moniki_leases(
+        name TEXT NOT NULL PRIMARY KEY,
+        worker TEXT NOT NULL,
+        expires TIMESTAMP NOT NULL
+    );
+    """,
+]
+
+
+def _connect() -> sqlite3.Connection:
+    """Открывает соединение с БД с включенной проверкой внешних ключей и ожиданием занятой БД."""
+    con = sqlite3.connect(PATH_DB, timeout=BUSY_TIMEOUT)
+    con.execute("PRAGMA foreign_keys = 1")
+    return con
+
+
+def schema_version() -> int:
+    """Номер последней примененной миграции схемы."""
+    con = _connect()
+    try:
+        return con.execute("PRAGMA user_version").fetchone()[0]
+    finally:
+        con.close()
+
+
+def report_duplicate_directions(con: sqlite3.Connection) -> list:
+    """
+    Номера направлений, которые встречаются в moniki_records больше одного раза. Если они есть, то пишет их в лог:
+    миграция 1 оставит по одной строке, а лишние перенесет в moniki_records_duplicates.
+    """
+    numbers = [row[0] for row in con.execute(
+        """SELECT number_direct FROM moniki_records GROUP BY number_direct HAVING COUNT(*) > 1""")]
+    if numbers:
+        logging.warning(
+            f"Повторяющиеся номера направлений: {', '.join(map(str, numbers))}. Остается записанная или последняя "
+            f"добавленная строка, остальные переносятся в moniki_records_duplicates.")
+    return numbers
+
+
+def migrate() -> int:
+    """
+    Переводит БД в режим WAL(форма на Flask и скрипт не блокируют друг друга на чтении)
+    и применяет недостающие миграции из MIGRATIONS. Возвращает номер версии схемы после миграции.
+    Если схема уже актуальна, то стоит одного чтения PRAGMA.
+    """
+    con = _connect()
+    try:
+        if con.execute("PRAGMA journal_mode").fetchone()[0] != "wal":
+            con.execute("PRAGMA journal_mode = WAL")
+        version = con.execute("PRAGMA user_version").fetchone()[0]
+        for number in range(version, len(MIGRATIONS)):
+            if number == 0:
+                report_duplicate_directions(con)
+            con.executescript(f"BEGIN;\n{MIGRATIONS[number]}\nPRAGMA user_version = {number + 1};\nCOMMIT;")
+        return max(version, len(MIGRATIONS))
+    except Exception:
+        if con.in_transaction:
+            con.rollback()
+        raise
+    finally:
+        con.close()
+
+
+class BdSession:
+    """
+    Сессия работы с БД для одного воркера(потока/процесса).
+    Держит одно соединение на всё время жизни воркера, а блок with - это единица работы:
+    все изменения внутри него сохраняются одной транзакцией при выходе, при ошибке откатываются.
+    Вложенные блоки with не коммитят, коммит делает только самый внешний.
+        with bd.session():
+            bd.change_value_specialty('Кардиология', 3)
+            bd.put_change_data('Кардиология', -3)
+    """
+
+    def __init__(self):
+        self.con: sqlite3.Connection = None
+        self.depth: int = 0
+
+    @property
+    def active(self) -> bool:
+        """Открыта ли сейчас единица работы."""
+        return self.depth > 0
+
+    def connection(self) -> sqlite3.Connection:
+        """Возвращает соединение воркера, открывая его при первом обращении."""
+        if self.con is None:
+            self.con = _connect()
+        return self.con
+
+    def __enter__(self):
+        self.connection()
+        self.depth += 1
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.depth -= 1
+        if self.depth == 0:
+            if exc_type is None:
+                self.con.commit()
+            else:
+                self.con.rollback()
+        return False
+
+    def close(self):
+        """Закрывает соединение воркера."""
+        if self.con is not None:
+            self.con.close()
+            self.con = None
+
+
+_local = threading.local()
+
+
+def session() -> BdSession:
+    """Возвращает сессию текущего воркера, создавая её при первом обращении."""
+    if getattr(_local, "session", None) is None:
+        _local.session = BdSession()
+    return _local.session
+
+
+def close_session():
+    """Закрывает соединение сессии текущего воркера, если оно было открыто."""
+    if getattr(_local, "session", None) is not None:
+        _local.session.close()
+        _local.session = None
+
+
+def _active_session():
+    """Возвращает сессию текущего воркера, если внутри неё открыта единица работы, иначе None."""
+    current = getattr(_local, "session", None)
+    if current is not None and current.active:
+        return current
+    return None
+
+
 def sql_operation(func):
-    """Декоратор для открытия и закрытия соединения с БД с сохранением данных."""
+    """
+    Декоратор для открытия и закрытия соединения с БД с сохранением данных.
+    Если открыта сессия(bd.session()), то использует её соединение, а сохранение оставляет сессии.
+    """
     def wrapper(*args, **kwargs):
+        current = _active_session()
+        if current is not None:
+            return func(current.connection().cursor(), *args, **kwargs)
         try:
-            con = sqlite3.connect(PATH_DB)
-            con.execute("PRAGMA foreign_keys = 1")
+            con = _connect()
             cur = con.cursor()
-            func(cur, *args, **kwargs)
+            result = func(cur, *args, **kwargs)
             con.commit()
         finally:
             con.close()
+        return result
     return wrapper
 
 
-def get_data_all_records() -> dict:
+def sql_read(func):
+    """Декоратор для чтения из БД: использует соединение открытой сессии или открывает своё и закрывает его."""
+    def wrapper(*args, **kwargs):
+        current = _active_session()
+        if current is not None:
+            return func(current.connection().cursor(), *args, **kwargs)
+        con = _connect()
+        try:
+            return func(con.cursor(), *args, **kwargs)
+        finally:
+            con.close()
+    return wrapper
+
+
+@sql_read
+def get_data_all_records(cur) -> list:
     """Берет информацию из тыблица по записям из moniki_records."""
-    try:
-        con = sqlite3.connect(PATH_DB)
-        cur = con.cursor()
-        cur.execute("""SELECT * FROM moniki_records""")
-        data = cur.fetchall()
-    finally:
-        con.close()
-        return data
+    cur.execute("""SELECT * FROM moniki_records""")
+    return cur.fetchall()
 
 
-def get_data_all_specialty() -> dict:
+@sql_read
+def get_data_all_specialty(cur) -> dict:
     """Берет информацию из базы по специальностям и количеству ячеек из moniki_specialties."""
-    try:
-        con = sqlite3.connect(PATH_DB)
-        cur = con.cursor()
-        cur.execute("""SELECT * FROM moniki_specialties""")
-        data = {name: value for name, value in cur.fetchall()}
-    finally:
-        con.close()
-        return data
+    cur.execute("""SELECT * FROM moniki_specialties""")
+    return {name: value for name, value in cur.fetchall()}
 
 
 @sql_operation
@@ -177,9 +409,46 @@ def _change_status_record(cur, number_direct: str, value: int):
 
 @sql_operation
 def put_change_data(cur, specialty: str, value: int):
-    """Добавляет в таблицу moniki_data отметку о времени появления более 2 ячеек."""
-    record = (d.now(), specialty, value)
+    """
+    Добавляет в таблицу moniki_data отметку о времени появления более 2 ячеек
+    и в той же транзакции обновляет сводки открытий по часу и дню недели(нужна миграция 2, ее применяет moniki.setup()).
+    """
+    moment = d.now()
+    record = (moment, specialty, value)
     cur.execute("""INSERT INTO moniki_data VALUES(?, ?, ?)""", record)
+    for table, column, key in (
+            ("moniki_openings_hour", "hour", moment.hour),
+            ("moniki_openings_weekday", "weekday", moment.weekday())):
+        cur.execute(
+            f""" INSERT INTO {table} VALUES(?, ?, 1, ?)
+                ON CONFLICT(name, {column}) DO UPDATE
+                SET openings = openings + 1,
+                    talons = talons + excluded.talons""",
+            (specialty, key, -value)
+        )
+
+
+@sql_read
+def get_opening_distribution(cur, specialty: str = None, normalize: bool = True) -> dict:
+    """
+    Возвращает распределение открытий ячеек по часу суток и дню недели(0 - понедельник) из сводок.
+    Если специальность не передана, то по всем специальностям вместе.
+        {'openings': всего открытий, 'hour': {час: доля}, 'weekday': {день: доля}}
+    При normalize=False вместо долей количество открытий.
+    """
+    result = {}
+    for table, column in (("moniki_openings_hour", "hour"), ("moniki_openings_weekday", "weekday")):
+        if specialty is None:
+            cur.execute(f"""SELECT {column}, SUM(openings) FROM {table} GROUP BY {column}""")
+        else:
+            cur.execute(f"""SELECT {column}, openings FROM {table} WHERE name = (?)""", (specialty,))
+        result[column] = {key: count for key, count in cur.fetchall() if count > 0}
+    total = sum(result["hour"].values())
+    result["openings"] = total
+    if normalize and total:
+        for column in ("hour", "weekday"):
+            result[column] = {key: count / total for key, count in result[column].items()}
+    return result
 
 
 @sql_operation
@@ -193,7 +462,8 @@ def put_record(
         date_changes: str = None,
         specific: str = None,
         comment: str = None,
-        notified: bool = False
+        notified: bool = False,
+        priority: int = 0
         ):
     """
     Добавляет в таблицу moniki_records новое направление для отслеживания.
@@ -201,10 +471,15 @@ def put_record(
     Для поиска по фамилии вводим 'ФИО: ', по такому шаблону скрипт далее разделяет специфику(регистр специфики не важен, но важен для фио).
     Помимо этого, если нужно искать несколько ФИО, то следует их вводить через запятую с пробелом:
     "Ахмат, Сидор, Иванов", при этом регистр ФИО имеет значения.
+    priority - приоритет в очереди записи, больше - раньше(нужна миграция 4).
     """
     record = (d.now(), number_direct, specialty, is_recorded, date_direct, time_direct, date_changes, specific, comment, notified)
-    cur.execute("""
-        INSERT INTO moniki_records VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""", record)
+    columns = "date_adding, number_direct, name, is_recorded, date_direct, time_direct, date_changes, specific, comment, notified"
+    if priority:
+        record += (priority,)
+        columns += ", priority"
+    cur.execute(f"""
+        INSERT INTO moniki_records({columns}) VALUES({", ".join("?" * len(record))})""", record)
 
 
 @sql_operation
@@ -221,18 +496,173 @@ def change_datetime_record(cur, is_recorded: int, date_direct: str, time_direct:
     )
 
 
-def get_not_recorder() -> list:
+@sql_read
+def get_not_recorder(cur) -> list:
     """Возвращает список кортежей номера не записанных направлений и специальности из moniki_records.
+    Старые направления идут первыми.
         [(номер направления, специальность, специфика), (номер направления, специальность, специфика), ...]
     """
-    try:
-        con = sqlite3.connect(PATH_DB)
-        cur = con.cursor()
-        cur.execute("""SELECT number_direct, name, specific FROM moniki_records WHERE is_recorded = 0""")
-        data = cur.fetchall()
-    finally:
-        con.close()
-        return data
+    cur.execute("""SELECT number_direct, name, specific FROM moniki_records WHERE is_recorded = 0 ORDER BY date_adding, rowid""")
+    return cur.fetchall()
+
+
+@sql_read
+def get_count_talons(cur, specialty: str) -> int:
+    """Текущее количество свободных талонов специальности из moniki_specialties, 0 - если специальности нет."""
+    cur.execute("""SELECT count_talons FROM moniki_specialties WHERE name = (?)""", (specialty,))
+    row = cur.fetchone()
+    return row[0] if row else 0
+
+
+@sql_read
+def get_settled_groups(cur, specialty: str, talons: int, stale_seconds: int) -> set:
+    """
+    Специфики специальности, которые не нужно проверять заново: последний поиск не записал пациента,
+    количество талонов с тех пор не изменилось и прошло меньше stale_seconds секунд.
+    """
+    fresh_since = d.fromtimestamp(d.now().timestamp() - stale_seconds).strftime("%Y-%m-%d %H:%M:%S")
+    cur.execute(
+        """ SELECT specific FROM moniki_scan_state
+            WHERE name = (?) AND talons_seen = (?) AND outcome != 'booked' AND checked_at > (?)""",
+        (specialty, talons, fresh_since)
+    )
+    return {specific for specific, in cur.fetchall()}
+
+
+@sql_operation
+def put_scan_state(cur, specialty: str, specific: str, talons: int, outcome: str):
+    """Сохраняет итог поиска по группе направлений и количество талонов, при котором он был."""
+    cur.execute(
+        """ INSERT INTO moniki_scan_state VALUES(?, ?, ?, ?, ?)
+            ON CONFLICT(name, specific) DO UPDATE
+            SET talons_seen = excluded.talons_seen,
+                outcome = excluded.outcome,
+                checked_at = excluded.checked_at""",
+        (specialty, specific, talons, outcome, d.now().strftime("%Y-%m-%d %H:%M:%S"))
+    )
+
+
+# Сколько еще пациентов можно записать по специальностям из pending(CTE с колонкой name) с учетом квот за
+# календарный день и за последний час: NULL - без ограничения. Записи считаются по idx_records_name_changes.
+QUOTA_LEFT_CTE = """
+    quota AS (
+        SELECT
+            p.name,
+            COALESCE(q.per_day, :per_day) AS per_day,
+            COALESCE(q.per_hour, :per_hour) AS per_hour,
+            (SELECT COUNT(*) FROM moniki_records r
+                WHERE r.name = p.name AND r.date_changes >= :day_start AND r.is_recorded = 1) AS done_day,
+            (SELECT COUNT(*) FROM moniki_records r
+                WHERE r.name = p.name AND r.date_changes >= :hour_start AND r.is_recorded = 1) AS done_hour
+        FROM pending p LEFT JOIN moniki_quotas q ON q.name = p.name
+    ), remaining AS (
+        SELECT
+            name,
+            CASE
+                WHEN per_day > 0 AND per_hour > 0 THEN MIN(per_day - done_day, per_hour - done_hour)
+                WHEN per_day > 0 THEN per_day - done_day
+                WHEN per_hour > 0 THEN per_hour - done_hour
+            END AS remaining
+        FROM quota
+    )
+    """
+
+
+def default_quotas() -> tuple:
+    """
+    Сколько пациентов по специальности записывать за календарный день и за последний час, если в moniki_quotas
+    для специальности ничего не задано(MONIKI_QUOTA_DAY, по умолчанию 1, и MONIKI_QUOTA_HOUR, по умолчанию 0),
+    0 - без ограничения. Читается при вызове, а не при импорте, так как .env загружается в moniki.setup().
+    """
+    return int(os.getenv("MONIKI_QUOTA_DAY", "1")), int(os.getenv("MONIKI_QUOTA_HOUR", "0"))
+
+
+def _quota_params(per_day: int = None, per_hour: int = None) -> dict:
+    """Параметры для QUOTA_LEFT_CTE: квоты по умолчанию и начало текущего дня и последнего часа."""
+    moment = d.now()
+    default_day, default_hour = default_quotas()
+    return {
+        "per_day": default_day if per_day is None else per_day,
+        "per_hour": default_hour if per_hour is None else per_hour,
+        "day_start": moment.strftime("%Y-%m-%d 00:00:00"),
+        "hour_start": d.fromtimestamp(moment.timestamp() - 3600).strftime("%Y-%m-%d %H:%M:%S"),
+    }
+
+
+@sql_read
+def get_backlog(cur, per_day: int = None, per_hour: int = None) -> list:
+    """
+    Очередь записи на этот запуск: не записанные направления по приоритету(больше - раньше) и давности,
+    только по специальностям, где еще не выбрана квота записей за календарный день и за последний час.
+    Квоты берутся из moniki_quotas, а если там для специальности пусто - из per_day/per_hour(по умолчанию
+    default_quotas()), 0 - без ограничения. Записи считаются по date_changes индексом, без чтения всей таблицы.
+        [(номер направления, специальность, специфика, сколько еще можно записать или None), ...]
+    """
+    cur.execute(
+        f""" WITH pending AS (SELECT DISTINCT name FROM moniki_records WHERE is_recorded = 0), {QUOTA_LEFT_CTE}
+            SELECT r.number_direct, r.name, r.specific, o.remaining
+            FROM moniki_records r JOIN remaining o ON o.name = r.name
+            WHERE r.is_recorded = 0 AND (o.remaining IS NULL OR o.remaining > 0)
+            ORDER BY r.priority DESC, r.date_adding, r.rowid""",
+        _quota_params(per_day, per_hour)
+    )
+    return cur.fetchall()
+
+
+@sql_read
+def get_quota_left(cur, specialty: str) -> int:
+    """Сколько еще пациентов по специальности можно записать сейчас с учетом квот, None - без ограничения."""
+    cur.execute(
+        f""" WITH pending AS (SELECT :name AS name), {QUOTA_LEFT_CTE}
+            SELECT MAX(remaining, 0) FROM remaining""",
+        {"name": specialty, **_quota_params()}
+    )
+    return cur.fetchone()[0]
+
+
+@sql_operation
+def set_priority(cur, number_direct: str, priority: int) -> bool:
+    """Меняет приоритет направления в очереди записи. Возвращает False, если направления нет."""
+    cur.execute("""UPDATE moniki_records SET priority = (?) WHERE number_direct = (?)""", (priority, number_direct))
+    return cur.rowcount == 1
+
+
+@sql_operation
+def set_quota(cur, specialty: str, per_day: int = None, per_hour: int = None):
+    """Задает квоты записи для специальности, None - брать значение по умолчанию(default_quotas)."""
+    cur.execute(
+        """ INSERT INTO moniki_quotas VALUES(?, ?, ?)
+            ON CONFLICT(name) DO UPDATE
+            SET per_day = excluded.per_day,
+                per_hour = excluded.per_hour""",
+        (specialty, per_day, per_hour)
+    )
+
+
+@sql_operation
+def acquire_lease(cur, specialty: str, worker: str, ttl_seconds: int) -> bool:
+    """
+    Берет аренду специальности(moniki_leases) для воркера на ttl_seconds секунд. Возвращает True, если аренда получена.
+    Аренду можно взять, если её нет, она просрочена или уже принадлежит этому воркеру - так она и продлевается.
+    Одним запросом вставляет или перехватывает аренду, rowcount показывает, получилось ли.
+    """
+    now_str = d.now().strftime("%Y-%m-%d %H:%M:%S")
+    expires = d.fromtimestamp(d.now().timestamp() + ttl_seconds).strftime("%Y-%m-%d %H:%M:%S")
+    cur.execute(
+        """ INSERT INTO moniki_leases VALUES(?, ?, ?)
+            ON CONFLICT(name) DO UPDATE
+            SET worker = excluded.worker,
+                expires = excluded.expires
+            WHERE moniki_leases.expires < (?) OR moniki_leases.worker = excluded.worker""",
+        (specialty, worker, expires, now_str)
+    )
+    return cur.rowcount == 1
+
+
+@sql_operation
+def release_lease(cur, specialty: str, worker: str):
+    """Снимает аренду специальности, если она принадлежит этому воркеру."""
+    cur.execute("""DELETE FROM moniki_leases WHERE name = (?) AND worker = (?)""", (specialty, worker))
 
 
 def _adding_record_in_bd():
@@ -241,16 +671,25 @@ def _adding_record_in_bd():
     spec = input('Введите специальность:\n')
     specific = input('Введите специфику, если нет, нажмите Enter:\n')
     comment = input('Введите кого после записи оповестить: \n')
-    if specific == '':
-        put_record(nmr_direction, spec, 0, comment=comment.strip())
-    else:
-        put_record(nmr_direction, spec, 0, specific=specific.strip(), comment=comment.strip())
+    try:
+        if specific == '':
+            put_record(nmr_direction, spec, 0, comment=comment.strip())
+        else:
+            put_record(nmr_direction, spec, 0, specific=specific.strip(), comment=comment.strip())
+    except sqlite3.IntegrityError:
+        print(f'Направление {nmr_direction} уже есть в БД или специальности {spec} нет в moniki_specialties.')
 
 
 @sql_operation
 def _delete_data_over_30_days(cur):
-    """Удаляет из таблицы moniki_data информацию о добавлении записей старше 30 дней."""
+    """
+    Удаляет из таблицы moniki_data информацию о добавлении записей старше 30 дней и пересчитывает сводки открытий
+    (нужна миграция 2).
+    """
     cur.execute("""DELETE FROM moniki_data WHERE date_adding < datetime('now', '-30 days')""")
+    for statement in REBUILD_OPENINGS.split(";"):
+        if statement.strip():
+            cur.execute(statement)
 
 
 @sql_operation
@@ -316,6 +755,12 @@ if __name__ == "__main__":
     # print(get_not_recorder())
 
     # По сути это нужно для взаимодействия с БД через терминал/консоль. По умолчанию используется приложение на Flask.
+    try:
+        from dotenv import load_dotenv
+
+        load_dotenv()
+    except ImportError:
+        pass
     args = sys.argv
     if len(args) == 1:
         print('Не передан ни один аргумент, передайте help.')
@@ -328,9 +773,15 @@ if __name__ == "__main__":
             '-- Изменить статус записи по номеру направления передайте chg_status\n'
             '-- Для удаления строки с направлением передайте del_record\n'
             '-- Для смены статуса оповещения ntf\n'
+            '-- Для применения миграций схемы БД(индексы, WAL) передайте migrate\n'
+            '-- Для смены приоритета направления в очереди записи передайте priority\n'
+            '-- Для задания квот записи по специальности за день и за час передайте quota\n'
+            '-- Для просмотра очереди записи с учетом приоритетов и квот передайте backlog\n'
             )
     elif args[1] == 'add':
         _adding_record_in_bd()
+    elif args[1] in ('del', 'priority', 'quota', 'backlog') and schema_version() < len(MIGRATIONS):
+        print(f'Схема БД устарела(версия {schema_version()} из {len(MIGRATIONS)}), сначала передайте migrate.')
     elif args[1] == 'del':
         _delete_data_over_30_days()
         print('Записи о добавлении расписания датой добавления более 30 дней - удалены.')
@@ -349,6 +800,26 @@ if __name__ == "__main__":
         number_direct = input('Введите номер направления:\n').strip()
         _delete_row_record(number_direct)
         print(f'Направление с номером {number_direct} успешно удалено!')
+    elif args[1] == 'migrate':
+        print(f'Схема БД обновлена до версии {migrate()}.')
+    elif args[1] == 'priority':
+        number_direct = input('Введите номер направления:\n').strip()
+        priority = input('Введите приоритет (целое число, больше - раньше, по умолчанию 0):\n').strip()
+        if not priority.lstrip('-').isdigit():
+            print(f'Приоритет должен быть целым числом. Передано <{priority}>')
+        elif set_priority(number_direct, int(priority)):
+            print(f'Приоритет направления {number_direct} изменён на {priority}.')
+        else:
+            print(f'Направления {number_direct} нет в БД.')
+    elif args[1] == 'quota':
+        spec = input('Введите специальность:\n').strip()
+        per_day = input('Сколько пациентов в день (0 - без ограничения, Enter - по умолчанию):\n').strip()
+        per_hour = input('Сколько пациентов в час (0 - без ограничения, Enter - по умолчанию):\n').strip()
+        set_quota(spec, int(per_day) if per_day else None, int(per_hour) if per_hour else None)
+        print(f'Квоты для специальности {spec} сохранены.')
+    elif args[1] == 'backlog':
+        for num, elem in enumerate(get_backlog()):
+            print(f'{num}. Номер направления: {elem[0]}.\n Специальность: {elem[1]}.\n Специфика: {elem[2]}.\n Можно записать: {elem[3] if elem[3] is not None else "без ограничения"}')
     elif args[1] == 'ntf':
         number_direct = input('Введите номер направления:\n').strip()
         change_notified_status(number_direct)
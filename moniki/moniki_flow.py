@@ -0,0 +1,133 @@
+"""
+Ход работы скрипта по МОНИКИ как цепочка шагов с контрольными точками вместо перезапуска main() с нуля.
+Контрольные точки две независимые:
+    * сессия: START -> LOGGED_IN(вошли в ЕМИАС) -> DIRECTIONS_OPEN(окно с направлениями открыто);
+    * работа: START -> TALONS_HARVESTED(талоны собраны) -> DONE, а внутри записи - направление и неделя, на которых были.
+Шаг, чья контрольная точка уже пройдена, не повторяется. При ошибке вызывается восстановление(Sel.recover), которое
+выясняет, что из сессии осталось живым, и цепочка продолжается с последней живой точки, запись - с того же направления
+и той же недели. Перезапусков не больше MONIKI_RESTART_BUDGET за один прогон, дальше RestartBudgetExceeded.
+"""
+
+import logging
+import os
+import time
+
+import moniki_timing as timing
+
+START = "start"
+LOGGED_IN = "logged_in"
+DIRECTIONS_OPEN = "directions_open"
+TALONS_HARVESTED = "talons_harvested"
+DONE = "done"
+
+SESSION, WORK = "session", "work"
+STAGES = {
+    SESSION: (START, LOGGED_IN, DIRECTIONS_OPEN),
+    WORK: (START, TALONS_HARVESTED, DONE),
+}
+
+
+def restart_budget() -> int:
+    """Сколько раз за прогон можно восстановиться после ошибки(MONIKI_RESTART_BUDGET, по умолчанию 5)."""
+    return int(os.getenv("MONIKI_RESTART_BUDGET", "5"))
+
+
+def restart_pause() -> float:
+    """Пауза перед восстановлением, секунды(MONIKI_RESTART_PAUSE, по умолчанию 2)."""
+    return float(os.getenv("MONIKI_RESTART_PAUSE", "2"))
+
+
+class RestartBudgetExceeded(Exception):
+    """Ошибки повторяются, а перезапуски за прогон кончились."""
+
+
+class Checkpoint:
+    """Где сейчас сессия и работа, а при записи - какое направление и какая неделя в работе."""
+
+    def __init__(self):
+        self.session: str = START
+        self.work: str = START
+        self.direction: str = None
+        self.week: int = 0
+
+    def passed(self, kind: str, stage: str) -> bool:
+        """Пройдена ли контрольная точка stage цепочки kind(SESSION или WORK)."""
+        order = STAGES[kind]
+        return order.index(getattr(self, kind)) >= order.index(stage)
+
+    def reach(self, kind: str, stage: str):
+        """Отмечает пройденную точку. Назад не откатывает, для этого set_session."""
+        if not self.passed(kind, stage):
+            setattr(self, kind, stage)
+
+    def set_session(self, stage: str):
+        """Выставляет точку сессии по итогам восстановления, в том числе назад."""
+        self.session = stage
+
+    def start_work(self):
+        """Новый прогон работы: талоны и запись сначала, сессия остается как есть."""
+        self.work = START
+        self.direction, self.week = None, 0
+
+    def at_week(self, direction: str, week: int):
+        """Запись дошла до недели week направления direction."""
+        self.direction, self.week = direction, week
+
+    def resume_week(self, direction: str) -> int:
+        """С какой недели продолжать направление: с той, где упали, если оно и было в работе, иначе с нулевой."""
+        return self.week if direction == self.direction else 0
+
+    def direction_done(self):
+        """Направление разобрано до конца, продолжать его не нужно."""
+        self.direction, self.week = None, 0
+
+    def __str__(self) -> str:
+        place = f", направление {self.direction}, неделя {self.week}" if self.direction else ""
+        return f"сессия {self.session}, работа {self.work}{place}"
+
+
+class Flow:
+    """
+    Прогоняет шаги [(имя, SESSION или WORK, контрольная точка, функция), ...] по порядку, пропуская пройденные.
+    После ошибки вызывает recover() и продолжает с первого не пройденного шага, пока не кончится budget(None - из
+    MONIKI_RESTART_BUDGET). Бюджет и пауза читаются при создании Flow, а не при импорте, так как .env загружается
+    в moniki.setup().
+    on_step(имя) вызывается перед каждым шагом, например, чтобы подписать снимки страницы при ошибках.
+    """
+
+    def __init__(self, checkpoint: Checkpoint, steps: list, recover, budget: int = None, on_step=None):
+        self.checkpoint = checkpoint
+        self.steps = steps
+        self.recover = recover
+        self.budget = restart_budget() if budget is None else budget
+        self.pause = restart_pause()
+        self.on_step = on_step
+        self.restarts = 0
+
+    def run(self) -> Checkpoint:
+        """Прогон до конца цепочки. Ошибка в восстановлении тоже тратит перезапуск."""
+        error = None
+        while True:
+            try:
+                if error is not None:
+                    logging.info(f"Восстанавливаюсь после ошибки, контрольная точка: {self.checkpoint}.")
+                    with timing.span("flow.recover"):
+                        self.recover()
+                    logging.info(f"Продолжаю с контрольной точки: {self.checkpoint}.")
+                for name, kind, stage, step in self.steps:
+                    if self.checkpoint.passed(kind, stage):
+                        continue
+                    if self.on_step is not None:
+                        self.on_step(name)
+                    with timing.span(f"flow.{name}"):
+                        step()
+                    self.checkpoint.reach(kind, stage)
+                return self.checkpoint
+            except Exception as err:
+                self.restarts += 1
+                if self.restarts > self.budget:
+                    raise RestartBudgetExceeded(
+                        f"Перезапуски кончились({self.budget}), контрольная точка: {self.checkpoint}") from err
+                logging.error(f"Ошибка в шаге, перезапуск {self.restarts} из {self.budget}\n{err}", exc_info=True)
+                error = err
+                time.sleep(self.pause)
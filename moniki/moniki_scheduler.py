@@ -0,0 +1,109 @@
+"""
+Адаптивное расписание опроса ЕМИАС вместо ровных schedule.every(4).minutes.
+Интервал до следующего запуска считается по истории открытий ячеек(сводки moniki_openings_hour/weekday):
+в часы и дни, когда ячейки открывают чаще среднего, опрашиваем чаще, вплоть до MONIKI_POLL_FLOOR минут,
+в холодные окна реже, до MONIKI_POLL_CEIL минут, ночью - раз в MONIKI_POLL_NIGHT минут.
+После каждого запуска интервал пересчитывается, поэтому новые открытия из put_change_data сразу влияют на план.
+Настройки(poll_settings) читаются при создании AdaptiveScheduler, а не при импорте, так как .env загружается
+в moniki.setup().
+"""
+
+from datetime import datetime as d, timedelta
+import logging
+import os
+
+import schedule
+
+import moniki_bd as bd
+
+# За сколько минут до горячего часа уже начинать опрашивать чаще.
+LEAD_MINUTES = 10
+
+TAG = "moniki"
+
+
+def poll_settings() -> dict:
+    """
+    Настройки расписания из переменных окружения, интервалы - в минутах:
+        * base(MONIKI_POLL_BASE, 4) - интервал, пока истории мало, и средний интервал для окна с обычной частотой;
+        * floor(MONIKI_POLL_FLOOR, 1) и ceil(MONIKI_POLL_CEIL, 15) - пределы интервала;
+        * night(MONIKI_POLL_NIGHT, 30) - интервал ночью;
+        * night_hours(MONIKI_NIGHT_HOURS, "22-7") - ночь в формате "начало-конец" часов;
+        * min_openings(MONIKI_POLL_MIN_OPENINGS, 20) - меньше стольких открытий в истории интервал не адаптируется.
+    """
+    return {
+        "base": float(os.getenv("MONIKI_POLL_BASE", "4")),
+        "floor": float(os.getenv("MONIKI_POLL_FLOOR", "1")),
+        "ceil": float(os.getenv("MONIKI_POLL_CEIL", "15")),
+        "night": float(os.getenv("MONIKI_POLL_NIGHT", "30")),
+        "night_hours": tuple(int(hour) for hour in os.getenv("MONIKI_NIGHT_HOURS", "22-7").split("-")),
+        "min_openings": int(os.getenv("MONIKI_POLL_MIN_OPENINGS", "20")),
+    }
+
+
+def is_night(moment: d, night_hours: tuple = None) -> bool:
+    """
+    Попадает ли время в ночные часы night_hours(по умолчанию из poll_settings), интервал может переходить
+    через полночь.
+    """
+    start, end = poll_settings()["night_hours"] if night_hours is None else night_hours
+    if start <= end:
+        return start <= moment.hour < end
+    return moment.hour >= start or moment.hour < end
+
+
+def window_heat(moment: d, distribution: dict) -> float:
+    """
+    Во сколько раз в это окно открытий больше, чем в среднем: доля часа к 1/24, умноженная на долю дня недели к 1/7.
+    Если до следующего часа меньше LEAD_MINUTES, то берется более горячий из двух часов.
+    """
+    hours, weekdays = distribution["hour"], distribution["weekday"]
+    hour_share = hours.get(moment.hour, 0)
+    ahead = moment + timedelta(minutes=LEAD_MINUTES)
+    if ahead.hour != moment.hour:
+        hour_share = max(hour_share, hours.get(ahead.hour, 0))
+    return hour_share * 24 * weekdays.get(moment.weekday(), 0) * 7
+
+
+def interval_minutes(moment: d, distribution: dict, settings: dict = None) -> float:
+    """
+    Интервал до следующего опроса для момента moment по распределению открытий из bd.get_opening_distribution
+    и настройкам settings(по умолчанию poll_settings()).
+    """
+    settings = poll_settings() if settings is None else settings
+    if is_night(moment, settings["night_hours"]):
+        return settings["night"]
+    if distribution["openings"] < settings["min_openings"]:
+        return settings["base"]
+    heat = window_heat(moment, distribution)
+    if heat <= 0:
+        return settings["ceil"]
+    return min(settings["ceil"], max(settings["floor"], settings["base"] / heat))
+
+
+class AdaptiveScheduler:
+    """Запускает job по schedule с интервалом, который пересчитывается после каждого запуска."""
+
+    def __init__(self, job):
+        self.job = job
+        self.settings: dict = poll_settings()
+        self.interval: float = self.settings["base"]
+
+    def plan(self) -> float:
+        """Пересчитывает интервал по сводкам открытий и перевешивает задачу в schedule."""
+        try:
+            self.interval = interval_minutes(d.now(), bd.get_opening_distribution(), self.settings)
+        except Exception as err:
+            logging.error(f"Не смог посчитать интервал опроса, беру базовый\n{err}", exc_info=True)
+            self.interval = self.settings["base"]
+        schedule.clear(TAG)
+        schedule.every(max(1, round(self.interval * 60))).seconds.do(self.run).tag(TAG)
+        logging.info(f"Следующий опрос ЕМИАС через {self.interval:.1f} мин.")
+        return self.interval
+
+    def run(self):
+        """Запуск job и перепланирование."""
+        try:
+            self.job()
+        finally:
+            self.plan()
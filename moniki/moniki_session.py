@@ -0,0 +1,175 @@
+"""
+Сохранение входа в ЕМИАС между запусками браузера.
+После полного входа куки и localStorage каждого открытого окна и адрес окна с направлениями шифруются(Fernet из
+cryptography) и пишутся в файл. Новый браузер открывает по легкой странице на каждом домене, кладет туда куки и
+localStorage и сразу открывает окно с направлениями, минуя вход. Если ЕМИАС сессию не принял - полный вход.
+Настройки читаются при вызове, а не при импорте, так как .env загружается в moniki.setup():
+    * MONIKI_SESSION_KEY - ключ Fernet, без него сессия не сохраняется;
+    * MONIKI_SESSION_FILE - файл сессии, по умолчанию moniki_session.bin рядом со скриптом;
+    * MONIKI_SESSION_MAX_AGE - сколько минут сохраненная сессия считается годной, по умолчанию 240.
+Новый ключ и удаление сохраненной сессии:
+    python moniki_session.py key
+    python moniki_session.py forget
+"""
+
+from urllib.parse import urlsplit
+import json
+import logging
+import os
+import sys
+import time
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Страница, которую браузер открывает на домене, чтобы положить туда куки: маленькая и без скриптов.
+LIGHT_PAGE = "/robots.txt"
+
+JS_GET_LOCAL_STORAGE = "return Object.assign({}, window.localStorage);"
+JS_SET_LOCAL_STORAGE = """
+const items = arguments[0];
+for (const key of Object.keys(items)) {
+    window.localStorage.setItem(key, items[key]);
+}
+"""
+JS_CLEAR_STORAGE = "window.localStorage.clear(); window.sessionStorage.clear();"
+
+
+def session_file() -> str:
+    """Путь к файлу сохраненной сессии."""
+    return os.getenv("MONIKI_SESSION_FILE", os.path.join(BASE_DIR, "moniki_session.bin"))
+
+
+def _fernet():
+    """Шифровальщик Fernet по ключу MONIKI_SESSION_KEY или None, если ключа или cryptography нет."""
+    key = os.getenv("MONIKI_SESSION_KEY")
+    if not key:
+        return None
+    try:
+        from cryptography.fernet import Fernet
+    except ImportError:
+        logging.info("Пакет cryptography не установлен, сессия ЕМИАС не сохраняется.")
+        return None
+    try:
+        return Fernet(key.encode("ascii"))
+    except ValueError as err:
+        logging.error(f"MONIKI_SESSION_KEY не ключ Fernet, сессия ЕМИАС не сохраняется\n{err}")
+        return None
+
+
+def is_enabled() -> bool:
+    """Включено ли сохранение сессии: задан ключ и установлен cryptography."""
+    return _fernet() is not None
+
+
+def origin(url: str) -> str:
+    """Схема и домен адреса: https://host:port."""
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+def collect(browser, directions_url: str) -> dict:
+    """
+    Снимает сессию с браузера: куки и localStorage каждого окна(по одному разу на домен) и адрес окна с направлениями.
+    Активное окно после сбора остается тем же.
+    """
+    current = browser.current_window_handle
+    origins = {}
+    for handle in browser.window_handles:
+        browser.switch_to.window(handle)
+        url = browser.current_url
+        if not url.startswith("http") or origin(url) in origins:
+            continue
+        origins[origin(url)] = {
+            "cookies": browser.get_cookies(),
+            "local_storage": browser.execute_script(JS_GET_LOCAL_STORAGE) or {},
+        }
+    browser.switch_to.window(current)
+    return {"saved": time.time(), "directions_url": directions_url, "origins": origins}
+
+
+def save(state: dict):
+    """Шифрует сессию и атомарно записывает в файл, читать его может только владелец."""
+    fernet = _fernet()
+    if fernet is None:
+        return
+    path = session_file()
+    temp = f"{path}.{os.getpid()}.tmp"
+    with open(temp, "wb") as file:
+        file.write(fernet.encrypt(json.dumps(state).encode("utf-8")))
+    os.chmod(temp, 0o600)
+    os.replace(temp, path)
+    logging.info(f"Сессия ЕМИАС сохранена, доменов: {len(state['origins'])}.")
+
+
+def load() -> dict:
+    """
+    Читает и расшифровывает сохраненную сессию. None, если ее нет, она старше MONIKI_SESSION_MAX_AGE минут
+    или не расшифровывается текущим ключом - такой файл удаляется.
+    """
+    fernet = _fernet()
+    path = session_file()
+    if fernet is None or not os.path.exists(path):
+        return None
+    from cryptography.fernet import InvalidToken
+
+    max_age = int(float(os.getenv("MONIKI_SESSION_MAX_AGE", "240")) * 60)
+    try:
+        with open(path, "rb") as file:
+            return json.loads(fernet.decrypt(file.read(), ttl=max_age))
+    except (InvalidToken, ValueError):
+        logging.info("Сохраненная сессия ЕМИАС устарела или зашифрована другим ключом, удаляю.")
+        forget()
+        return None
+
+
+def forget():
+    """Удаляет сохраненную сессию."""
+    try:
+        os.remove(session_file())
+    except FileNotFoundError:
+        pass
+
+
+def apply(browser, state: dict):
+    """
+    Кладет сессию в браузер: на каждом домене открывает LIGHT_PAGE, добавляет живые куки и localStorage,
+    затем открывает адрес окна с направлениями во втором окне, как после обычного входа.
+    """
+    now = time.time()
+    for site, data in state["origins"].items():
+        browser.get(site + LIGHT_PAGE)
+        for cookie in data["cookies"]:
+            if cookie.get("expiry") and cookie["expiry"] < now:
+                continue
+            browser.add_cookie(cookie)
+        if data["local_storage"]:
+            browser.execute_script(JS_SET_LOCAL_STORAGE, data["local_storage"])
+    browser.switch_to.new_window("tab")
+    browser.get(state["directions_url"])
+
+
+def clear(browser, state: dict):
+    """
+    Убирает из браузера следы сессии, которую не приняли: на каждом ее домене открывает LIGHT_PAGE и удаляет куки
+    и хранилища. delete_all_cookies чистит только домен открытой страницы, поэтому обходятся все домены.
+    """
+    for site in state["origins"]:
+        browser.get(site + LIGHT_PAGE)
+        browser.delete_all_cookies()
+        browser.execute_script(JS_CLEAR_STORAGE)
+
+
+if __name__ == "__main__":
+    args = sys.argv
+    if len(args) == 1 or args[1] == 'help':
+        print(
+            '-- Для создания ключа MONIKI_SESSION_KEY передайте key.\n'
+            '-- Для удаления сохраненной сессии передайте forget.\n'
+            )
+    elif args[1] == 'key':
+        from cryptography.fernet import Fernet
+
+        print(Fernet.generate_key().decode("ascii"))
+    elif args[1] == 'forget':
+        forget()
+        print(f'Сохраненная сессия удалена: {session_file()}')
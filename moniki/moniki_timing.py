@@ -0,0 +1,154 @@
+"""
+Замер времени шагов скрипта по МОНИКИ.
+Каждый метод Sel и каждая фаза main() оборачивается в span, длительности копятся в памяти и дописываются
+в JSONL файл(по строке на span) в конце тика или когда буфер наполнился, поэтому на горячем пути только perf_counter.
+Сводка p50/p95/max по шагам:
+    python moniki_timing.py summary [путь к файлу]
+Настройки читаются при вызове, а не при импорте, так как .env загружается в moniki.setup():
+    * MONIKI_TIMING=1 - включить замеры, по умолчанию выключены;
+    * MONIKI_TIMING_FILE - файл замеров, по умолчанию moniki_timing.jsonl рядом со скриптом;
+    * MONIKI_TIMING_MAX_MB - размер файла, после которого он переименовывается в .1(старый .1 удаляется),
+      по умолчанию 50 МБ.
+"""
+
+from contextlib import contextmanager
+from datetime import datetime as d
+import functools
+import json
+import math
+import os
+import sys
+import time
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Сколько span держать в памяти до записи в файл.
+BUFFER_SIZE = 200
+
+_buffer: list = []
+_tick: str = None
+
+
+def is_enabled() -> bool:
+    """Включены ли замеры."""
+    return os.getenv("MONIKI_TIMING", "0") == "1"
+
+
+def timing_file() -> str:
+    """Путь к файлу замеров."""
+    return os.getenv("MONIKI_TIMING_FILE", os.path.join(BASE_DIR, "moniki_timing.jsonl"))
+
+
+def max_bytes() -> int:
+    """Размер файла замеров, после которого он ротируется."""
+    return int(float(os.getenv("MONIKI_TIMING_MAX_MB", "50")) * 1024 * 1024)
+
+
+def start_tick() -> str:
+    """Начинает новый тик: все следующие span помечаются его id."""
+    global _tick
+    _tick = d.now().strftime("%Y%m%d%H%M%S")
+    return _tick
+
+
+def current_tick() -> str:
+    """Id текущего тика или None, если тик не начат."""
+    return _tick
+
+
+def record(name: str, duration: float, ok: bool = True, **tags):
+    """Добавляет в буфер готовый замер длительности шага в секундах."""
+    if not is_enabled():
+        return
+    item = {"tick": _tick, "step": name, "sec": round(duration, 4), "ok": ok, "pid": os.getpid()}
+    if tags:
+        item.update(tags)
+    _buffer.append(item)
+    if len(_buffer) >= BUFFER_SIZE:
+        flush()
+
+
+@contextmanager
+def span(name: str, **tags):
+    """Замеряет время блока with и записывает его под именем name. Ошибка внутри блока помечается ok=False."""
+    start = time.perf_counter()
+    ok = False
+    try:
+        yield
+        ok = True
+    finally:
+        record(name, time.perf_counter() - start, ok, **tags)
+
+
+def timed(name: str):
+    """Декоратор: замеряет каждый вызов функции под именем name."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def time_methods(cls):
+    """Декоратор класса: оборачивает в span все публичные методы, имя шага - 'Класс.метод'."""
+    for attr, value in list(vars(cls).items()):
+        if callable(value) and not attr.startswith("_"):
+            setattr(cls, attr, timed(f"{cls.__name__}.{attr}")(value))
+    return cls
+
+
+def flush():
+    """Дописывает накопленные замеры в файл и очищает буфер. Если файл вырос больше max_bytes(), он уходит в .1."""
+    if not _buffer:
+        return
+    lines = "".join(json.dumps(item, ensure_ascii=False) + "\n" for item in _buffer)
+    _buffer.clear()
+    path = timing_file()
+    try:
+        if os.path.getsize(path) >= max_bytes():
+            os.replace(path, f"{path}.1")
+    except FileNotFoundError:
+        pass
+    with open(path, "a", encoding="utf-8") as file:
+        file.write(lines)
+
+
+def percentile(values: list, share: float) -> float:
+    """Перцентиль по ближайшему рангу для отсортированного списка."""
+    index = max(0, min(len(values) - 1, math.ceil(share * len(values)) - 1))
+    return values[index]
+
+
+def summary(path: str = None) -> list:
+    """
+    Возвращает [(шаг, количество, p50, p95, max), ...] по файлу замеров(по умолчанию timing_file()),
+    самые долгие по p95 сверху.
+    """
+    steps = {}
+    with open(path or timing_file(), encoding="utf-8") as file:
+        for line in file:
+            item = json.loads(line)
+            steps.setdefault(item["step"], []).append(item["sec"])
+    rows = []
+    for step, values in steps.items():
+        values.sort()
+        rows.append((step, len(values), percentile(values, 0.5), percentile(values, 0.95), values[-1]))
+    rows.sort(key=lambda row: row[3], reverse=True)
+    return rows
+
+
+def print_summary(path: str = None):
+    """Печатает сводку по шагам в консоль."""
+    print(f"{'Шаг':<45} {'N':>6} {'p50':>8} {'p95':>8} {'max':>8}")
+    for step, count, p50, p95, maximum in summary(path):
+        print(f"{step:<45} {count:>6} {p50:>8.3f} {p95:>8.3f} {maximum:>8.3f}")
+
+
+if __name__ == "__main__":
+    args = sys.argv
+    if len(args) == 1 or args[1] == 'help':
+        print('-- Для сводки p50/p95/max по шагам передайте summary и, если нужно, путь к файлу замеров.')
+    elif args[1] == 'summary':
+        print_summary(args[2] if len(args) > 2 else None)
@@ -0,0 +1,96 @@
+"""
+Пул воркеров для записи пациентов по направлениям из moniki_records.
+Каждый воркер - отдельный процесс со своим браузером(SeleniumBrow) и своим входом в ЕМИАС.
+Направления раздаются по специальностям через очередь, а специальность закрепляется за воркером арендой в таблице
+moniki_leases, поэтому два воркера(или два наложившихся запуска по расписанию) не бьются за одни и те же талоны.
+Количество воркеров ограничено переменной окружения MONIKI_WORKERS.
+"""
+
+import logging
+import multiprocessing
+import os
+import queue
+
+import moniki_bd as bd
+import moniki_flow as flow
+import moniki_timing as timing
+
+
+def max_workers() -> int:
+    """
+    Максимальное количество одновременно работающих браузеров для записи(MONIKI_WORKERS), 1 - запись в основном
+    браузере по очереди. Читается при вызове, а не при импорте, так как .env загружается в moniki.setup().
+    """
+    return int(os.getenv("MONIKI_WORKERS", "1"))
+
+
+def lease_seconds() -> int:
+    """
+    На сколько секунд специальность закрепляется за воркером(MONIKI_LEASE_SECONDS), читается при вызове.
+    Аренда продлевается после каждого направления, поэтому хватать должно на запись одного направления.
+    """
+    return int(os.getenv("MONIKI_LEASE_SECONDS", "900"))
+
+
+def run_worker(tasks, worker: str, log_name: str):
+    """
+    Тело процесса воркера: забирает специальности из очереди, пока она не опустеет, и записывает по ним.
+    Браузер запускается при первой специальности и закрывается, когда очередь пуста. Ошибки в записи специальности
+    разбираются с последней контрольной точки(moniki_flow), вход повторяется, только если сессия потеряна.
+    Лог воркера - moniki_class.<log_name>.log, log_name не содержит pid, чтобы файлы не копились от запуска к запуску.
+    """
+    from moniki import Sel, book_specialty, pending_records, setup
+
+    setup(worker=log_name)
+    s = None
+    try:
+        while True:
+            try:
+                spec, records = tasks.get(timeout=1)
+            except queue.Empty:
+                logging.info(f"[{worker}] Очередь специальностей пуста, завершаю работу.")
+                break
+            if s is None:
+                logging.info(f"[{worker}] Запускаю браузер и вхожу в ЕМИАС.")
+                s = Sel()
+            logging.info(f"[{worker}] Беру специальность {spec}, направлений: {len(records)}.")
+            s.checkpoint.start_work()
+            # Направления перечитываются из БД при каждом запуске шага: после ошибки и восстановления записанные
+            # до неё уже не в очереди, а список из задачи остался прежним.
+            steps = s.session_steps() + [
+                ("book_specialty", flow.WORK, flow.DONE,
+                 lambda: book_specialty(s, spec, pending_records(spec), worker=worker)),
+            ]
+            flow.Flow(s.checkpoint, steps, s.recover, on_step=s.mark_step).run()
+    except Exception as err:
+        logging.error(f"[{worker}] Ошибка в воркере записи\n{err}", exc_info=True)
+    finally:
+        if s is not None:
+            try:
+                s.sel.quit()
+            except Exception:
+                pass
+        bd.close_session()
+        timing.flush()
+
+
+def run_pool(groups: dict, limit: int = None):
+    """
+    Раздает специальности с направлениями {специальность: [(номер, специфика), ...]} пулу процессов и ждет их завершения.
+    Процессов запускается не больше limit(по умолчанию max_workers()) и не больше, чем специальностей.
+    """
+    limit = max_workers() if limit is None else limit
+    ctx = multiprocessing.get_context("spawn")
+    tasks = ctx.Queue()
+    for item in groups.items():
+        tasks.put(item)
+    count = min(limit, len(groups))
+    processes = [
+        ctx.Process(target=run_worker, args=(tasks, f"worker-{os.getpid()}-{number}", f"worker-{number}"))
+        for number in range(count)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    logging.info(f"Пул из {count} воркеров закончил запись.")
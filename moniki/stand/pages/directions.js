@@ -0,0 +1,139 @@
+// Окно направлений заглушки ЕМИАС: всё, что видит скрипт, рисуется из JSON ответов сервера.
+var current = {number: null, specialty: null, week: 0, cells: [], cell: null, time: null};
+var pending = 0;
+
+function request(url, options) {
+    pending += 1;
+    document.getElementById("spinner").classList.remove("hidden");
+    return fetch(url, options).then(function (response) {
+        return response.json();
+    }).finally(function () {
+        pending -= 1;
+        if (pending === 0) {
+            document.getElementById("spinner").classList.add("hidden");
+        }
+    });
+}
+
+function toggleFilters() {
+    document.getElementById("filters").classList.toggle("hidden");
+}
+
+function removeDoctor() {
+    document.getElementById("doctor-chip").remove();
+}
+
+function findDirection() {
+    var number = document.getElementById("direction-input").value.trim();
+    var rows = document.getElementById("directions");
+    rows.innerHTML = "";
+    request("/api/directions?number=" + encodeURIComponent(number)).then(function (data) {
+        current.number = data.number;
+        current.specialty = data.specialty;
+        rows.innerHTML = '<tr class="direction-row"><td class="direction-number">' + data.number + '</td>' +
+            '<td>' + data.specialty + '</td>' +
+            '<td><button class="mat-mdc-tooltip-trigger icon-button icon-eye-icon" onclick="openCard()"></button></td></tr>';
+    });
+}
+
+function openCard() {
+    document.getElementById("card-number").textContent = "Направление " + current.number;
+    document.getElementById("card").classList.remove("hidden");
+}
+
+function openWizard() {
+    document.getElementById("wizard").classList.remove("hidden");
+    current.week = 0;
+    loadWeek();
+}
+
+function closeWizard() {
+    ["wizard", "card", "specialties", "record-date", "write-button"].forEach(function (id) {
+        document.getElementById(id).classList.add("hidden");
+    });
+    document.getElementById("schedule").innerHTML = "";
+    document.getElementById("times").innerHTML = "";
+}
+
+function loadWeek() {
+    document.getElementById("schedule").innerHTML = "";
+    document.getElementById("times").innerHTML = "";
+    document.getElementById("record-date").classList.add("hidden");
+    document.getElementById("week-title").textContent = "Неделя " + (current.week + 1);
+    var url = "/api/schedule?specialty=" + encodeURIComponent(current.specialty) + "&week=" + current.week;
+    request(url).then(function (data) {
+        current.cells = data.cells;
+        var grid = document.getElementById("schedule");
+        if (data.cells.length === 0) {
+            return;
+        }
+        grid.innerHTML = '<div class="schedule-grid">' + data.cells.map(function (cell, index) {
+            return '<div class="cell free" data-index="' + index + '" onclick="clickCell(' + index + ')">' +
+                '<div class="cell-doctor">' + cell.doctor + '</div>' +
+                '<div class="cell-date">' + cell.date + '</div>' +
+                '<div class="cell-free">Свободно: ' + cell.times.length + '</div></div>';
+        }).join("") + '</div>';
+    });
+}
+
+function nextWeek() {
+    current.week += 1;
+    loadWeek();
+}
+
+function clickCell(index) {
+    var cells = document.querySelectorAll(".cell");
+    if (current.cell === index) {
+        // Повторный клик по активной ячейке возвращает все ячейки недели.
+        current.cell = null;
+        cells.forEach(function (cell) { cell.classList.remove("hidden", "active"); });
+        document.getElementById("record-date").classList.add("hidden");
+        document.getElementById("times").innerHTML = "";
+        return;
+    }
+    current.cell = index;
+    cells.forEach(function (cell) {
+        cell.classList.toggle("hidden", Number(cell.dataset.index) !== index);
+        cell.classList.toggle("active", Number(cell.dataset.index) === index);
+    });
+    var data = current.cells[index];
+    var field = document.getElementById("record-date");
+    field.textContent = data.date;
+    field.classList.remove("hidden");
+    document.getElementById("times").innerHTML = data.times.map(function (at) {
+        return '<button class="time-slot" onclick="selectTime(\'' + at + '\')">' + at + '</button>';
+    }).join("");
+}
+
+function selectTime(at) {
+    current.time = at;
+    document.getElementById("write-button").classList.remove("hidden");
+}
+
+function book() {
+    var cell = current.cells[current.cell];
+    request("/api/book", {
+        method: "POST",
+        headers: {"Content-Type": "application/json"},
+        body: JSON.stringify({specialty: current.specialty, week: current.week, doctor: cell.doctor, date: cell.date, time: current.time})
+    }).then(function () {
+        document.getElementById("dialog").classList.remove("hidden");
+    });
+}
+
+function closeDialog() {
+    document.getElementById("dialog").classList.add("hidden");
+    current.cell = null;
+    loadWeek();
+}
+
+function showSpecialties() {
+    request("/api/specialties").then(function (data) {
+        var table = document.getElementById("specialties");
+        table.innerHTML = data.specialties.map(function (spec) {
+            return '<div class="specialty-row"><div class="specialty-name">' + spec.name + '</div>' +
+                '<div class="specialty-count">Свободно: ' + spec.free + '</div></div>';
+        }).join("");
+        table.classList.remove("hidden");
+    });
+}
@@ -0,0 +1,166 @@
+"""
+Локальная замена ЕМИАС для замеров скорости скрипта по МОНИКИ без доступа к настоящему сервису.
+Отдает страницы входа, меню, окна направлений с поиском, шагом 2(таблица специальностей), недельной сеткой
+расписания, крутилками и окном записи, а данные для них - JSON запросами, как это делает ЕМИАС:
+    * GET  /api/directions?number=N - направление и его специальность;
+    * GET  /api/specialties - специальности и количество свободных талонов;
+    * GET  /api/schedule?specialty=S&week=K - ячейки врачей на неделю K от текущей;
+    * POST /api/book - запись на время, занимает талон;
+    * GET  /assets/<имя>.png|.woff2|.js - картинки, шрифты и скрипты для тяжелой страницы portal.html.
+Каждый JSON ответ и файл из /assets задерживается на --latency мс, чтобы крутилки были видны как на настоящем сайте.
+Запуск:
+    python server.py --port 8765 --latency 300 --seed 1
+"""
+
+from datetime import date, timedelta
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+import argparse
+import json
+import os
+import random
+import threading
+import time
+
+PAGES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "pages")
+
+SPECIALTIES = [
+    "Аллергология и иммунология",
+    "Гастроэнтерология",
+    "Кардиология",
+    "Неврология",
+    "Онкология",
+    "Офтальмология",
+    "Ревматология",
+    "Эндокринология",
+]
+DOCTORS = ["Иванов И.И.", "Петрова А.С.", "Сидоров П.П.", "Кузнецова Е.В."]
+# Тип и размер файлов из /assets, как у картинок, шрифтов и скриптов портала ЕМИАС.
+ASSETS = {".png": ("image/png", 40_000), ".woff2": ("font/woff2", 60_000), ".js": ("application/javascript", 0)}
+TIMES = ["09:00", "09:30", "10:00", "11:15", "12:40", "14:00", "15:20"]
+
+
+class StandState:
+    """Состояние заглушки: расписание по специальностям и неделям, меняется при записи."""
+
+    def __init__(self, seed: int = 1, weeks: int = 8):
+        self.lock = threading.Lock()
+        self.rnd = random.Random(seed)
+        self.booked = []
+        monday = date.today() - timedelta(days=date.today().weekday())
+        self.schedule = {}
+        for spec in SPECIALTIES:
+            for week in range(weeks):
+                cells = []
+                for doctor in DOCTORS:
+                    # Примерно половина недель у специальности пустые, как в жизни.
+                    if self.rnd.random() < 0.5:
+                        continue
+                    day = monday + timedelta(days=week * 7 + self.rnd.randrange(5))
+                    times = sorted(self.rnd.sample(TIMES, self.rnd.randrange(0, 4)))
+                    cells.append({"doctor": f"{doctor} ({spec})", "date": day.strftime("%d.%m.%Y"), "times": times})
+                self.schedule[(spec, week)] = cells
+
+    def specialties(self) -> list:
+        """Специальности и сумма свободных времен по всем неделям."""
+        with self.lock:
+            result = []
+            for spec in SPECIALTIES:
+                free = sum(len(cell["times"]) for (name, _), cells in self.schedule.items() if name == spec for cell in cells)
+                result.append({"name": spec, "free": free})
+            return result
+
+    def week(self, spec: str, week: int) -> list:
+        """Ячейки недели для специальности."""
+        with self.lock:
+            return json.loads(json.dumps(self.schedule.get((spec, week), [])))
+
+    def book(self, spec: str, week: int, doctor: str, day: str, at: str) -> bool:
+        """Занимает время в ячейке, если оно еще свободно."""
+        with self.lock:
+            for cell in self.schedule.get((spec, week), []):
+                if cell["doctor"] == doctor and cell["date"] == day and at in cell["times"]:
+                    cell["times"].remove(at)
+                    self.booked.append((spec, doctor, day, at))
+                    return True
+            return False
+
+
+class StandHandler(SimpleHTTPRequestHandler):
+    """Отдает страницы из pages/ и JSON API заглушки."""
+
+    state: StandState = None
+    latency: float = 0.3
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, directory=PAGES_DIR, **kwargs)
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, data, status: int = 200):
+        time.sleep(self.latency)
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_asset(self, path: str):
+        time.sleep(self.latency)
+        content_type, size = ASSETS.get(os.path.splitext(path)[1], ("application/octet-stream", 0))
+        body = b"void 0;" if content_type == "application/javascript" else bytes(size)
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Cache-Control", "no-store")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path.startswith("/assets/"):
+            return self.send_asset(url.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        if url.path == "/api/specialties":
+            return self.send_json({"specialties": self.state.specialties()})
+        if url.path == "/api/directions":
+            number = query.get("number", "")
+            spec = SPECIALTIES[sum(map(ord, number)) % len(SPECIALTIES)]
+            return self.send_json({"number": number, "specialty": spec})
+        if url.path == "/api/schedule":
+            week = int(query.get("week", 0))
+            return self.send_json({"week": week, "cells": self.state.week(query.get("specialty", ""), week)})
+        return super().do_GET()
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != "/api/book":
+            return self.send_json({"error": "not found"}, status=404)
+        data = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        done = self.state.book(data.get("specialty"), int(data.get("week", 0)), data.get("doctor"), data.get("date"), data.get("time"))
+        return self.send_json({"ok": done}, status=200 if done else 409)
+
+
+def make_server(port: int = 8765, latency_ms: int = 300, seed: int = 1) -> ThreadingHTTPServer:
+    """Создает сервер заглушки, не запуская его."""
+    handler = type("Handler", (StandHandler,), {"state": StandState(seed), "latency": latency_ms / 1000})
+    return ThreadingHTTPServer(("127.0.0.1", port), handler)
+
+
+def serve_in_thread(port: int = 8765, latency_ms: int = 300, seed: int = 1) -> ThreadingHTTPServer:
+    """Запускает сервер заглушки в фоновом потоке и возвращает его, остановка - server.shutdown()."""
+    server = make_server(port, latency_ms, seed)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Локальная заглушка ЕМИАС для замеров скрипта по МОНИКИ.")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=int, default=300, help="задержка JSON ответов, мс")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    print(f"Заглушка ЕМИАС: http://127.0.0.1:{args.port}/")
+    make_server(args.port, args.latency, args.seed).serve_forever()
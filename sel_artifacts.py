@@ -0,0 +1,234 @@
+"""
+Снимки страницы при ошибках: скриншот и DOM.
+Поток скрипта только забирает байты скриншота и page_source у браузера и кладет их в очередь, сжатие и запись делает
+фоновый поток. Снимки лежат в кольцевой папке ограниченного размера: когда она переполнена, удаляются самые старые.
+Имя снимка - тик, шаг и попытка, все снимки перечислены в index.jsonl(по строке на снимок).
+В одну папку могут писать несколько процессов(воркеры записи): индекс дописывается и чистится под блокировкой
+файла index.lock, размер папки каждый процесс ведет у себя и пересчитывает по диску, только когда он перевалил за предел.
+    * SEL_ARTIFACTS=0 - не снимать;
+    * SEL_ARTIFACTS_DIR - папка, по умолчанию artifacts рядом с этим файлом;
+    * SEL_ARTIFACTS_MAX_MB - предельный размер папки, по умолчанию 200 МБ.
+Настройки читаются при первом снимке, а не при импорте, так как .env загружается позже.
+"""
+
+from contextlib import contextmanager
+from datetime import datetime as d
+import atexit
+import gzip
+import json
+import logging
+import os
+import queue
+import re
+import threading
+import time
+
+if os.name == "nt":
+    import msvcrt
+else:
+    import fcntl
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+INDEX = "index.jsonl"
+LOCK = "index.lock"
+# Сколько снимков может ждать записи. Если очередь полна, то новый снимок отбрасывается, а не тормозит скрипт.
+QUEUE_SIZE = 16
+
+
+def is_enabled() -> bool:
+    """Снимать ли страницу при ошибках."""
+    return os.getenv("SEL_ARTIFACTS", "1") == "1"
+
+
+def artifacts_dir() -> str:
+    """Папка снимков."""
+    return os.getenv("SEL_ARTIFACTS_DIR", os.path.join(BASE_DIR, "artifacts"))
+
+
+def max_folder_bytes() -> int:
+    """Предельный размер папки снимков."""
+    return int(float(os.getenv("SEL_ARTIFACTS_MAX_MB", "200")) * 1024 * 1024)
+
+
+def _safe(text) -> str:
+    """Часть имени файла: только буквы, цифры, точка, дефис и подчеркивание."""
+    return re.sub(r"[^\w.-]+", "-", str(text)).strip("-") or "none"
+
+
+@contextmanager
+def _locked(path: str):
+    """Межпроцессная блокировка на время блока with через файл path."""
+    with open(path, "a+b") as file:
+        if os.name == "nt":
+            file.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(file.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    time.sleep(0.05)
+            try:
+                yield
+            finally:
+                file.seek(0)
+                msvcrt.locking(file.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            fcntl.flock(file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(file.fileno(), fcntl.LOCK_UN)
+
+
+class ArtifactWriter:
+    """
+    Фоновый поток, который сжимает и пишет снимки в кольцевую папку directory не больше max_bytes.
+    None - из SEL_ARTIFACTS_DIR и SEL_ARTIFACTS_MAX_MB.
+    """
+
+    def __init__(self, directory: str = None, max_bytes: int = None, queue_size: int = QUEUE_SIZE):
+        self.directory = artifacts_dir() if directory is None else directory
+        self.max_bytes = max_folder_bytes() if max_bytes is None else max_bytes
+        self.items = queue.Queue(maxsize=queue_size)
+        self.dropped = 0
+        self._seq = 0
+        # Размер папки по оценке этого процесса: скан при первой записи плюс размеры своих снимков.
+        self._total: int = None
+        self._thread = threading.Thread(target=self._run, name="sel-artifacts", daemon=True)
+        self._thread.start()
+
+    def submit(self, key: dict, png: bytes = None, html: str = None) -> bool:
+        """Отдает снимок фоновому потоку, не дожидаясь записи. False - очередь полна и снимок отброшен."""
+        try:
+            self.items.put_nowait((key, png, html))
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def flush(self):
+        """Ждет, пока все отданные снимки будут записаны."""
+        self.items.join()
+
+    def _run(self):
+        while True:
+            item = self.items.get()
+            try:
+                written = self._write(*item)
+                if self._total is None:
+                    self._total = sum(size for _, size, _ in self._scan())
+                else:
+                    self._total += written
+                if self._total > self.max_bytes:
+                    self._prune()
+            except Exception:
+                logging.error("Не смог записать снимок страницы.\n", exc_info=True)
+            finally:
+                self.items.task_done()
+
+    def _path(self, name: str) -> str:
+        """Полный путь к файлу name в папке снимков."""
+        return os.path.join(self.directory, name)
+
+    def _write(self, key: dict, png: bytes, html: str) -> int:
+        """
+        Пишет скриншот как есть(png уже сжат), DOM - в gzip, и добавляет строку в index.jsonl.
+        Возвращает, сколько байт записано.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        self._seq += 1
+        name = f"{_safe(key.get('tick'))}_{_safe(key.get('step'))}_{_safe(key.get('attempt'))}_{os.getpid()}-{self._seq}"
+        files = []
+        if png:
+            with open(os.path.join(self.directory, f"{name}.png"), "wb") as file:
+                file.write(png)
+            files.append(f"{name}.png")
+        if html is not None:
+            with gzip.open(os.path.join(self.directory, f"{name}.html.gz"), "wt", encoding="UTF-8", compresslevel=6) as file:
+                file.write(html)
+            files.append(f"{name}.html.gz")
+        entry = dict(key, name=name, files=files)
+        with _locked(self._path(LOCK)):
+            with open(self._path(INDEX), "a", encoding="UTF-8") as file:
+                file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        return sum(os.path.getsize(self._path(file)) for file in files)
+
+    def _scan(self) -> list:
+        """Снимки в папке: [(время изменения, размер, имя файла), ...] без индекса, блокировки и временных файлов."""
+        entries = []
+        for name in os.listdir(self.directory):
+            if name in (INDEX, LOCK) or name.endswith(".tmp"):
+                continue
+            try:
+                stat = os.stat(self._path(name))
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, name))
+        return entries
+
+    def _prune(self):
+        """
+        Пересчитывает размер папки по диску и, если она больше max_bytes, удаляет самые старые снимки и переписывает
+        индекс без них. Все под блокировкой: другой процесс в это время не дописывает индекс и не чистит папку.
+        """
+        with _locked(self._path(LOCK)):
+            entries = self._scan()
+            total = sum(size for _, size, _ in entries)
+            if total > self.max_bytes:
+                kept = {name for _, _, name in entries}
+                for _, size, name in sorted(entries):
+                    if total <= self.max_bytes:
+                        break
+                    try:
+                        os.remove(self._path(name))
+                    except FileNotFoundError:
+                        pass
+                    kept.discard(name)
+                    total -= size
+                index = self._path(INDEX)
+                temp = f"{index}.{os.getpid()}.tmp"
+                with open(index, encoding="UTF-8") as file:
+                    lines = [line for line in file if kept.intersection(json.loads(line)["files"])]
+                with open(temp, "w", encoding="UTF-8") as file:
+                    file.writelines(lines)
+                os.replace(temp, index)
+        self._total = total
+
+
+_writer: ArtifactWriter = None
+_lock = threading.Lock()
+
+
+def get_writer() -> ArtifactWriter:
+    """Общий фоновый писатель снимков, запускается при первом снимке."""
+    global _writer
+    with _lock:
+        if _writer is None:
+            _writer = ArtifactWriter()
+            atexit.register(_writer.flush)
+        return _writer
+
+
+def capture(browser, step: str, attempt: int = 1, tick: str = None, screenshot: bool = True, dom: bool = True) -> bool:
+    """
+    Снимок страницы браузера для шага step и попытки attempt в тике tick(по умолчанию - текущее время).
+    В потоке скрипта только забирает скриншот и page_source, запись - в фоне. Возвращает, принят ли снимок.
+    """
+    if not is_enabled():
+        return False
+    key = {
+        "tick": tick or d.now().strftime("%Y%m%d%H%M%S"),
+        "step": step,
+        "attempt": attempt,
+        "at": d.now().strftime("%d.%m.%Y %H:%M:%S"),
+    }
+    try:
+        key["url"] = browser.current_url
+    except Exception:
+        key["url"] = None
+    png = browser.get_screenshot_as_png() if screenshot else None
+    html = browser.page_source if dom else None
+    accepted = get_writer().submit(key, png, html)
+    if not accepted:
+        logging.info(f"Очередь снимков полна, снимок {step} попытка {attempt} пропущен.")
+    return accepted